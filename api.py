@@ -1,20 +1,29 @@
 import os
-from flask import Flask
-from flask_restx import Api, Resource, fields, cors
+import json
+import logging
+from flask import Flask, Response, request, stream_with_context, g
+from flask_restx import Api, Resource, fields, cors, marshal, reqparse, inputs
 # from werkzeug.contrib.fixers import ProxyFix
 from flask_cors import CORS, cross_origin
 import numpy as np
-from elastic_util import ElasticUtil, ElasticUtilNameId
-from wikiscraper import WikiScraper
-from graph import pre_create_graph, create_graph
-
-app = Flask(__name__)
-app.config.PREFERRED_URL_SCHEME = 'https'
-# CORS(app, resources={r'/*': {'origins': ['http://localhost:3000', 'http://localhost']}})
-CORS(app)
-
-# app.wsgi_app = ProxyFix(app.wsgi_app)
-api = Api(app, version='0.0', title='Contents Network API',
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+from elastic_util import ElasticUtil, ElasticUtilNameId, PAGE_SIZE, es_params_from_env
+from wikiscraper import wiki_load, wiki_flight
+from graph import pre_create_graph, create_graph, prune_graph, graph_view_field, graph_views_from_buckets, count_once, \
+    VIEW_KEY, VIEW_MAPPING, VIEW_EDGES_FIELD, VIEW_SOURCE_FIELDS
+from graph_cache import graph_cache_from_env, key_from_id, key_from_data
+from content_cache import content_cache_from_env, doc_version
+from incremental_graph import UserGraphs, USER_GRAPHS_MAX
+from compact_graph import CompactGraph
+from bulk import bulk_load, items_from_csv
+from jobs import job_runner_from_env, JobQueueFull
+from single_flight import SingleFlight
+from metrics import REGISTRY, GRAPH_NODES, GRAPH_EDGES, stage, note, start_request, end_request
+from profiling import request_profiler_from_env, log_slow_request, SLOW_REQUEST_SECONDS
+from graph_format import FORMATS, MIN_COMPRESS_BYTES, to_compact, negotiate_mimetype, negotiate_encoding, encode, compress
+
+# routes are registered to the app made by create_app
+api = Api(version='0.0', title='Contents Network API',
     description='A simple Conents Network API',
     doc='/doc/',
 )
@@ -23,15 +32,23 @@ ns_users = api.namespace('users', description='users data')
 ns_contents = api.namespace('contents', description='contents data')
 ns_wiki = api.namespace('wiki', description='get data from wikipedia')
 ns_graphs = api.namespace('graph', description='contents graph')
+ns_jobs = api.namespace('jobs', description='background jobs')
 
 user = api.model('User', {
     'id': fields.String(attribute='_id', readonly=True, description='The name of user'),
     'data': fields.Raw(attribute='_source', required=True, description='Dict of contents and score')
 })
+# data of the content without the stored graph view
+class ContentData(fields.Raw):
+    def format(self, value):
+        if isinstance(value, dict) and VIEW_KEY in value:
+            return {k: v for k, v in value.items() if k != VIEW_KEY}
+        return value
+
 content = api.model('Content', {
     'name': fields.String(attribute='_source.name', description='The name of content'),
     'wiki_id': fields.Integer(required=False, default=-1, example=-1, description='The wikipedia page id'),
-    'data': fields.Raw(attribute='_source', default={}, required=True, description='data')
+    'data': ContentData(attribute='_source', default={}, required=True, description='data')
 })
 
 # need to be restful?
@@ -45,29 +62,74 @@ graph = api.model('Graph', {
     'graph': fields.Raw(readonly=True, description='nodes and edges')
 })
 
-try:
-    host = os.environ.get('ELASTIC_HOST', 'localhost')
-    port = os.environ.get('ELASTIC_PORT', 9200)
-    scheme = os.environ.get('ELASTIC_SCHEME', 'http')
-    http_auth = (os.environ.get('ELASTIC_USER', ''), os.environ.get('ELASTIC_PASS', ''))
-    eu_user = ElasticUtil(index='users', host=host, port=port, http_auth=http_auth, scheme=scheme)
-    eu_content = ElasticUtilNameId(index='contents',  host=host, port=port, http_auth=http_auth, scheme=scheme)
-except Exception as e:
-    print(e)
-    print('Can\'t connect to the elasticsearch')
-    eu_user = None
-    eu_content = None
-    exit()
-
+list_parser = reqparse.RequestParser()
+list_parser.add_argument('limit', type=int, default=PAGE_SIZE, location='args', help='Number of items in one page')
+list_parser.add_argument('cursor', type=str, location='args', help='X-Next-Cursor header of the previous page')
+list_parser.add_argument('format', type=str, choices=('json', 'ndjson'), default='json', location='args',
+                         help='ndjson streams all items, one json per line')
+
+# clients connect at the first request of each worker process
+# indexes are created beforehand by `python elastic_util.py`
+es_params = es_params_from_env()
+eu_user = ElasticUtil(index='users', bootstrap=False, **es_params)
+contents_index = os.environ.get('ELASTIC_CONTENTS_INDEX', 'contents')
+contents_id_mode = os.environ.get('ELASTIC_CONTENTS_ID_MODE', 'search')
+contents_layout = os.environ.get('ELASTIC_CONTENTS_LAYOUT', 'raw')
+content_cache = content_cache_from_env()
+# graph view of each content is computed when it is written. `python migrate.py graph_view` for old documents
+eu_content = ElasticUtilNameId(index=contents_index, id_mode=contents_id_mode, bootstrap=False, cache=content_cache,
+                               view=graph_view_field, layout=contents_layout, mappings=VIEW_MAPPING, **es_params)
+
+graph_cache = graph_cache_from_env()
+eu_user.add_listener(graph_cache.invalidate_user)
+eu_content.add_listener(graph_cache.invalidate_content)
+user_graphs = UserGraphs(max_users=int(os.environ.get('USER_GRAPHS_MAX', USER_GRAPHS_MAX)))
+eu_content.add_listener(user_graphs.invalidate_content)
+job_runner = job_runner_from_env()
+# concurrent builds of the same graph share one call. scrapes share wikiscraper.wiki_flight
+graph_flight = SingleFlight()
+REGISTRY.gauge('graph_cache_entries', 'Number of cached graph results', func=lambda: graph_cache.stats()['entries'])
+REGISTRY.gauge('graph_cache_bytes', 'Json size of cached graph results', func=lambda: graph_cache.stats()['bytes'])
+REGISTRY.gauge('user_graphs', 'Number of users whose incremental graph is kept', func=lambda: len(user_graphs))
+if content_cache is not None:
+    REGISTRY.gauge('content_cache_entries', 'Number of cached content documents', func=lambda: content_cache.stats()['entries'])
+    REGISTRY.gauge('content_cache_bytes', 'Json size of cached content documents', func=lambda: content_cache.stats()['bytes'])
+    REGISTRY.gauge('content_cache_hit_ratio', 'Hit ratio of the content cache', func=lambda: content_cache.stats()['hit_ratio'])
+REGISTRY.gauge('jobs_queued', 'Number of jobs waiting in the queue', func=lambda: job_runner.stats()['queued'])
+# networkx: create_graph and incremental graphs of users, compact: CompactGraph built per request
+graph_backend = os.environ.get('GRAPH_BACKEND', 'networkx')
+# graphs of at least this many checked contents load the contents with one aggregation of the graph view edges
+# instead of fetching the documents. 0 disables it
+graph_aggregation_min = int(os.environ.get('GRAPH_AGGREGATION_MIN_CONTENTS', 0))
+
+
+# list documents page by page. next cursor is returned in X-Next-Cursor header
+# or stream all documents as ndjson
+def list_response(eu, model):
+    args = list_parser.parse_args()
+    if args['format'] == 'ndjson':
+        def generate():
+            for doc in eu.scan():
+                yield json.dumps(marshal(doc, model), ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    res, code = eu.get_page(size=args['limit'], cursor=args['cursor'])
+    if code != 200:
+        return res, code
+    headers = {}
+    if res['next'] is not None:
+        headers['X-Next-Cursor'] = res['next']
+    return marshal(res['hits'], model), code, headers
 
 @ns_users.route('/')
 class UserList(Resource):
     '''Shows a list of all user, and lets you POST to add new tasks'''
     @ns_users.doc('List Users')
-    @ns_users.marshal_list_with(user)
+    @ns_users.expect(list_parser)
+    @ns_users.response(200, 'Success', [user])
     def get(self):
         '''List all Users'''
-        return eu_user.get_all()
+        return list_response(eu_user, user)
 
     @ns_users.doc('Create sers')
     @ns_users.expect(user)
@@ -103,18 +165,6 @@ def wiki_id_check(payload):
     else:
         return palyload['wiki_id']
 
-def wiki_load(name, wiki_id):
-    wsc = WikiScraper()
-    res, wiki_data = wsc.load(name=name, pageid=wiki_id, lang='ja')
-    if not res:
-        msg = name + ' not found in wikipedia. Please try again'
-        if api.payload['wiki_id']<0:
-            msg += ' or try with page id.'
-        else:
-            msg += '.'
-        return msg, 404
-    return wiki_data, 200
-
 @ns_wiki.route('/')
 class Wiki(Resource):
     '''get parsed data form wiki'''
@@ -125,21 +175,57 @@ class Wiki(Resource):
         print(wiki_load(api.payload['name'], wiki_id_check(api.payload)))
         return wiki_load(api.payload['name'], wiki_id_check(api.payload))
 
+async_parser = reqparse.RequestParser()
+async_parser.add_argument('async', type=inputs.boolean, default=False, location='args',
+                          help='Scrape and save in background. returns 202 and the job')
+
+# scrape the content if data is empty, and save it
+# create: create new content, or create/update with put
+def save_content(name, wiki_id, data, create=True):
+    #get data from wiki
+    if data=={} :
+        res, code = wiki_load(name, wiki_id)
+        if code==404:
+            return res, code
+        wiki_data = res
+    else:
+        wiki_data = data
+
+    #post data to the elastic search
+    if create:
+        res, code = eu_content.post(name, wiki_data)
+    else:
+        res, code = eu_content.put(name, wiki_data)
+    if code==200 or code==201:
+        return wiki_data, code
+    return res, code
+
+# run save_content in background and return 202 with the job, or 429 if the queue is full
+def save_content_async(name, wiki_id, data, create=True):
+    params = {'name': name, 'create': create}
+    try:
+        job = job_runner.submit('content', params, save_content, name, wiki_id, data, create)
+    except JobQueueFull as e:
+        return str(e), 429, {'Retry-After': '1'}
+    return job, 202, {'Location': api.url_for(Job, id=job['id'])}
+
 @ns_contents.route('/')
 class ContentList(Resource):
     '''Shows a list of all contents, and lets you POST to add new tasks'''
     @ns_contents.doc('List_Contents')
-    @ns_contents.marshal_list_with(content)
+    @ns_contents.expect(list_parser)
+    @ns_contents.response(200, 'Success', [content])
     def get(self):
         '''List all tasks'''
         # return DAO.Contents
-        return eu_content.get_all()
+        return list_response(eu_content, content)
 
     @ns_contents.doc('create_todo')
-    @ns_contents.expect(content)
+    @ns_contents.expect(content, async_parser)
     # @ns_contents.marshal_with(content, code=201)
     def post(self):
         '''Create a new task'''
+        args = async_parser.parse_args()
         name = api.payload['name']
 
         #check exist
@@ -147,22 +233,19 @@ class ContentList(Resource):
         if code != 404:
             return name + ' is exist', 400
 
-        #get data from wiki   
-        if api.payload['data']=={} :     
-            res, code = wiki_load(name, wiki_id_check(api.payload))
-            if code==404:
-                return res, code
-
-            wiki_data = res
-        else:
-            wiki_data = api.payload['data']
-
-        #post data to the elastic search
-        res, code = eu_content.post(name, wiki_data)
-        if code==201:
-            return wiki_data, code
+        if args['async']:
+            return save_content_async(name, wiki_id_check(api.payload), api.payload['data'])
+        return save_content(name, wiki_id_check(api.payload), api.payload['data'])
 
-        return res, code
+@ns_contents.route('/cache')
+class ContentCacheStats(Resource):
+    '''Statistics of the content cache'''
+    @ns_contents.doc('content_cache_stats')
+    def get(self):
+        '''Return hit/miss counters and size of the content cache'''
+        if content_cache is None:
+            return 'Content cache is disabled', 404
+        return content_cache.stats(), 200
 
 @ns_contents.route('/<string:name>')
 @ns_contents.response(404, 'Content not found')
@@ -174,117 +257,285 @@ class Content(Resource):
         '''Fetch a given resource'''
         return eu_content.get(name)
 
-    @ns_contents.expect(content)
+    @ns_contents.expect(content, async_parser)
     # @ns_contents.marshal_with(content)
     def put(self, name):
         '''Update a task given its identifier'''
-
-        #get data from wiki
+        args = async_parser.parse_args()
         print(api.payload)
-        if api.payload['data']=={} :
-            res, code = wiki_load(name, wiki_id_check(api.payload))
-            if code==404:
-                return res, code
-
-            wiki_data = res
-        else:
-            wiki_data = api.payload['data']
-
-        # print(wiki_data)
-        #post data to the elastic search
-        res, code = eu_content.put(name, wiki_data)
-        if code==200 or code==201:
-            return wiki_data, code
-
-        return res, code
-
+        if args['async']:
+            return save_content_async(name, wiki_id_check(api.payload), api.payload['data'], create=False)
+        return save_content(name, wiki_id_check(api.payload), api.payload['data'], create=False)
+
+@ns_jobs.route('/<string:id>')
+@ns_jobs.response(404, 'Job not found')
+class Job(Resource):
+    '''Status and result of a background job'''
+    @ns_jobs.doc('get_job')
+    def get(self, id):
+        '''Return status (queued, running, done or failed), status code and result of the job'''
+        job = job_runner.store.get(id)
+        if job is None:
+            return id + ' not found', 404
+        return job, 200
+
+
+graph_parser = reqparse.RequestParser()
+graph_parser.add_argument('max_nodes', type=int, location='args', help='Max number of nodes. contents are always kept')
+graph_parser.add_argument('min_point', type=float, location='args', help='Min point of attribute nodes')
+graph_parser.add_argument('min_degree', type=int, location='args', help='Min degree of attribute nodes')
+graph_parser.add_argument('format', type=str, choices=FORMATS, default='default', location='args',
+                          help='compact: node table and edges as index pairs with relations')
+
+# node budget and format of the query
+def graph_budget():
+    args = graph_parser.parse_args()
+    if args['max_nodes'] is not None and args['max_nodes'] < 0:
+        api.abort(400, 'max_nodes must not be negative')
+    return args
+
+# apply the node budget and the format of the query to the graph. the cached graph is not modified
+# str_edges: edges as str of the list in default format
+def graph_body(graph_res, budget, str_edges=False):
+    nodes, edges = prune_graph(graph_res['nodes'], graph_res['edges'],
+                               max_nodes=budget['max_nodes'], min_point=budget['min_point'], min_degree=budget['min_degree'])
+    if budget['format'] == 'compact':
+        relation_of = dict(zip(graph_res['edges'], graph_res['relations']))
+        return to_compact(nodes, edges, [relation_of[e] for e in edges])
+    return {'nodes': nodes, 'edges': str(edges) if str_edges else edges}
+
+# response encoded by Accept (json or msgpack) and compressed by Accept-Encoding (br or gzip)
+def graph_response(res, code=200):
+    mimetype = negotiate_mimetype(request.accept_mimetypes)
+    if mimetype is None:
+        api.abort(406, 'Acceptable types are application/json and application/msgpack')
+    with stage('graph_encode'):
+        data = encode(marshal(res, graph), mimetype)
+        headers = {'Vary': 'Accept, Accept-Encoding'}
+        encoding = negotiate_encoding(request.accept_encodings) if len(data) >= MIN_COMPRESS_BYTES else None
+        if encoding is not None:
+            data = compress(data, encoding)
+            headers['Content-Encoding'] = encoding
+    return Response(data, status=code, mimetype=mimetype, headers=headers)
+
+# get points of checked contents
+# input_data: dict of {name: {'point': float, 'checked': bool}}
+def checked_points(input_data):
+    points = {}
+    for name in input_data.keys():
+        if 'checked' in input_data[name].keys() and input_data[name]['checked']:
+            points[name] = float(input_data[name]['point'])
+    return points
+
+# get content data of the points with one batched lookup
+# return points and data of found contents, and version of each content like doc_version
+def load_contents(points):
+    # get_list logs the missing and duplicated names
+    res, code = eu_content.get_list(points.keys())
+    data = {}
+    versions = {}
+    for name, doc in res['found'].items():
+        data[name] = doc['_source']
+        versions[name] = doc_version(doc)
+    points = {name: point for name, point in points.items() if name in data}
+    return points, data, versions
+
+# points, data and versions of the contents like load_contents, for building the graph
+# large inputs use eu_content.aggregate if it is enabled. the data has only the graph view
+# contents without a current view are fetched, and all are fetched if the aggregation is not possible
+def load_graph_contents(points):
+    if graph_aggregation_min <= 0 or len(points) < graph_aggregation_min or not count_once:
+        return load_contents(points)
+    res = eu_content.aggregate(points.keys(), VIEW_EDGES_FIELD, VIEW_SOURCE_FIELDS)
+    if res is None:
+        note('contents_load', 'fallback')
+        return load_contents(points)
+
+    data, stale = graph_views_from_buckets(res['hits'], res['buckets'])
+    note('contents_load', 'aggregation')
+    note('aggregated_contents', len(data))
+    versions = {name: doc_version(hit) for name, hit in res['hits'].items()}
+    if len(stale):
+        stale_points, stale_data, stale_versions = load_contents({name: points[name] for name in stale})
+        data.update(stale_data)
+        versions.update(stale_versions)
+    missing = [name for name in points if name not in res['hits']]
+    if len(missing):
+        logging.warning(str(len(missing))+' contents not found: '+', '.join(missing))
+    points = {name: point for name, point in points.items() if name in data}
+    return points, data, versions
+
+# nodes, edges and relation of each edge of the graph of the contents with create_graph or CompactGraph
+def build_graph(points, data):
+    with stage('graph_build'):
+        input = pre_create_graph(points=points, data=data)
+        if graph_backend == 'compact':
+            cg = CompactGraph.from_input(input)
+            GRAPH_NODES.set(len(cg), 'compact')
+            GRAPH_EDGES.set(len(cg.src), 'compact')
+            note('nodes', len(cg))
+            note('attributes', len(cg) - len(input))
+            note('edges', len(cg.src))
+            return cg.nodes_dict(), cg.edge_list(), cg.edge_relations()
+        G = create_graph(input)
+        return graph_result(G, 'networkx')
+
+# backend: label of graph size metrics
+def graph_result(G, backend):
+    edges = list(G.edges)
+    GRAPH_NODES.set(len(G), backend)
+    GRAPH_EDGES.set(len(edges), backend)
+    note('nodes', len(G))
+    note('attributes', sum(1 for name, genre in G.nodes(data='genre') if genre == 'attribute'))
+    note('edges', len(edges))
+    return {name: dict(attrs) for name, attrs in G.nodes.items()}, edges, [G.edges[e]['relation'] for e in edges]
 
 @ns_graphs.route('/get_from_id/<string:id>')
 class GraphFromId(Resource):
     '''Show a single user'''
     @ns_graphs.doc('get_graph')
-    @ns_graphs.marshal_with(graph)
-    # @ns_graphs.expect(graph)
+    @ns_graphs.response(200, 'Success', graph)
+    @ns_graphs.expect(graph_parser)
     def get(self, id):
         '''Fetch a given User'''
 
+        budget = graph_budget()
         #get data from userid
+        generation = graph_cache.generation()
         res, code = eu_user.get(id)
         if code!=200:
             return res, code
 
         input_data = res['_source']
-        points = {}
-        data = {}
-        for name in input_data.keys() :
-            if 'checked' in input_data[name].keys() and 'checked':
-                points[name] = float(input_data[name])
-                res, code = eu_content.get(name)
-                if code==200:
-                    data[name] = res['_source']
-                else:
-                    print(res, code)
-
-        G = create_graph(pre_create_graph(points=points, data=data)) 
-        res = {'id': id, 'data':input_data, 'graph':{}}
-        res['graph']['nodes'] = dict(G.nodes)
-        res['graph']['edges'] = G.edges.__str__()
-
-        return res, 200
+        key = key_from_id(id, res)
+        checked = checked_points(input_data)
+        note('checked_contents', len(checked))
+        def build():
+            if graph_backend == 'compact':
+                points, data, versions = load_graph_contents(checked)
+                nodes, edges, relations = build_graph(points, data)
+                graph_res = {'nodes': nodes, 'edges': edges, 'relations': relations}
+            else:
+                # apply the difference from the last request of the user
+                # contents written by other processes are found by their versions and loaded again
+                def output(G):
+                    nodes, edges, relations = graph_result(G, 'incremental')
+                    return {'nodes': nodes, 'edges': edges, 'relations': relations}
+                with stage('graph_update'):
+                    graph_res = user_graphs.update(id, checked, load_graph_contents, output, versions=eu_content.versions)
+            graph_cache.put(key, graph_res, contents=checked.keys(), user=id, generation=generation)
+            return graph_res
+
+        graph_res = graph_cache.get(key)
+        if graph_res is None:
+            graph_res = graph_flight.do(key, build)
+
+        res = {'id': id, 'data':input_data, 'graph':graph_body(graph_res, budget, str_edges=True)}
+        return graph_response(res)
 
 @ns_graphs.route('/get_from_data')
 class GraphFromData(Resource):
     '''Show a single user'''
     @ns_graphs.doc('get_graph')
-    @ns_graphs.marshal_with(graph)
-    @ns_graphs.expect(graph)
+    @ns_graphs.response(200, 'Success', graph)
+    @ns_graphs.expect(graph, graph_parser)
     def post(self):
         '''Fetch a given User'''
 
+        budget = graph_budget()
         input_data = api.payload['data']
-        points = {}
-        data = {}
-        for name in input_data.keys() :
-            if 'checked' in input_data[name].keys() and input_data[name]['checked']:
-                res, code = eu_content.get(name)
-                if code==200:
-                    points[name] = float(input_data[name]['point'])
-                    data[name] = res['_source']
-                else:
-                    print(res, code)
+        generation = graph_cache.generation()
+        checked = checked_points(input_data)
+        note('checked_contents', len(checked))
+        points, data, versions = load_graph_contents(checked)
         # print(points, data)
 
-        G = create_graph(pre_create_graph(points=points, data=data)) 
-        res = {'id': id, 'data':input_data, 'graph':{}}
-        res['graph']['nodes'] = dict(G.nodes)
-        res['graph']['edges'] = list(G.edges)
+        key = key_from_data(points, versions)
+        def build():
+            nodes, edges, relations = build_graph(points, data)
+            graph_res = {'nodes': nodes, 'edges': edges, 'relations': relations}
+            graph_cache.put(key, graph_res, contents=points.keys(), generation=generation)
+            return graph_res
+
+        graph_res = graph_cache.get(key)
+        if graph_res is None:
+            graph_res = graph_flight.do(key, build)
+
+        res = {'id': id, 'data':input_data, 'graph':graph_body(graph_res, budget)}
+        return graph_response(res)
 
-        return res, 200
+@ns_graphs.route('/cache')
+class GraphCacheStats(Resource):
+    '''Statistics of the graph cache'''
+    @ns_graphs.doc('graph_cache_stats')
+    def get(self):
+        '''Return hit/miss counters and size of the graph cache'''
+        return graph_cache.stats(), 200
 
+@ns_graphs.route('/single_flight')
+class SingleFlightStats(Resource):
+    '''Statistics of coalesced calls'''
+    @ns_graphs.doc('single_flight_stats')
+    def get(self):
+        '''Return number of calls, executions and calls which waited for the same call in flight'''
+        return {'wiki': wiki_flight.stats(), 'graph': graph_flight.stats()}, 200
 
-# todo bulk api
-# @ns_contents.route('/bulk')
-# class ContentBulk(Resource):
-#     '''Shows a list of all todos, and lets you POST to add new tasks'''
-#     @ns_contents.doc('List_Contents')
-#     @ns_contents.marshal_list_with(content)
-#     def get(self):
-#         '''List all tasks'''
-#         # return DAO.Contents
-#         return eu_content.get_all()
-    
-#     @ns_contents.expect(content)
-#     @ns_contents.marshal_with(content)
-#     def put(self, name):
-#         '''Update a task given its identifier'''
 
-#         #todo
-#         # use wikiscraper class to get data
-#         # post with name
+bulk_parser = reqparse.RequestParser()
+bulk_parser.add_argument('overwrite', type=inputs.boolean, default=False, location='args', help='Update existing contents')
 
-#         res = eu_content.put(name)
-#         return 
+@ns_contents.route('/bulk')
+class ContentBulk(Resource):
+    '''Create multiple contents at once'''
+    @ns_contents.doc('bulk_create_contents', body=[content])
+    @ns_contents.expect(bulk_parser)
+    def post(self):
+        '''Create contents from json list or csv (text/csv) of name, wiki_id and data'''
+        args = bulk_parser.parse_args()
+        if request.mimetype == 'text/csv':
+            items = items_from_csv(request.get_data(as_text=True))
+        else:
+            items = request.get_json(silent=True)
+        if type(items)!=list:
+            return 'Body must be list of contents or csv', 400
+
+        return bulk_load(eu_content, items, overwrite=args['overwrite']), 200
+
+@api.errorhandler(ESConnectionError)
+def elasticsearch_unavailable(e):
+    '''Elasticsearch is not reachable'''
+    return {'message': 'Can\'t connect to the elasticsearch'}, 503
+
+# metrics in prometheus text format
+def metrics_response():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# application factory. production servers use wsgi.py
+def create_app():
+    app = Flask(__name__)
+    app.config.PREFERRED_URL_SCHEME = 'https'
+    # CORS(app, resources={r'/*': {'origins': ['http://localhost:3000', 'http://localhost']}})
+    CORS(app)
+
+    # app.wsgi_app = ProxyFix(app.wsgi_app)
+    api.init_app(app)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
+    profiler = request_profiler_from_env()
+    slow_seconds = float(os.environ.get('SLOW_REQUEST_SECONDS', SLOW_REQUEST_SECONDS))
+    @app.before_request
+    def before_request():
+        start_request()
+        g.profile = profiler.start() if profiler.requested(request) else None
+    @app.after_request
+    def after_request(response):
+        if g.get('profile') is not None:
+            response.headers['X-Profile-File'] = profiler.stop(g.profile, request.endpoint or 'none')
+        breakdown = end_request(request.endpoint or 'none', request.method, response.status_code)
+        log_slow_request(breakdown, request.method, request.path, response.status_code, threshold=slow_seconds)
+        return response
+    return app
 
 
 if __name__ == '__main__':
-    app.run(debug=True, ssl_context='adhoc')
\ No newline at end of file
+    create_app().run(debug=True, ssl_context='adhoc')
\ No newline at end of file
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# offline micro-benchmarks of the scraper, graph builder and elasticsearch layer
+# inputs are generated by synthetic.py and elasticsearch is es_stub.InMemoryElasticsearch
+# usage:
+#   python bench.py --output bench.json
+#   python bench.py --output new.json --compare bench.json --threshold 0.2
+#   python bench.py --filter graph --sizes 10 100
+# python -m pytest -q test_bench.py runs every suite once on small inputs
+
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import statistics
+from contextlib import redirect_stdout
+
+SIZES = [10, 100, 1000, 10000]
+REPEAT = 5
+THRESHOLD = 0.2 # regression if median is slower than this ratio
+PAGES = {'small': (1, 5), 'medium': (3, 20), 'large': (10, 60)} # sections and rows of synthetic_page
+ES_DOCS = 1000
+
+# run func repeat times after one warmup. setup() is called before each run and not timed
+# return dict of min, median and runs in seconds
+def measure(func, repeat=REPEAT, setup=None):
+    times = []
+    for i in range(repeat + 1):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(arg) if setup is not None else func()
+        elapsed = time.perf_counter() - start
+        if i > 0:
+            times.append(elapsed)
+    return {'min': min(times), 'median': statistics.median(times), 'runs': repeat}
+
+# benchmarks of WikiScraper on stored html
+def scraper_benchmarks(repeat):
+    from wikiscraper import WikiScraper, PARSERS, STAFF_HEADLINE
+    from synthetic import synthetic_page
+    results = {}
+    for parser in PARSERS:
+        try:
+            WikiScraper(parser=parser).load_html('check', '<html></html>')
+        except Exception as e: # lxml is optional
+            logging.warning('skip parser '+parser+': '+str(e))
+            continue
+        for size, (sections, rows) in PAGES.items():
+            html = synthetic_page(random.Random(0), sections, rows)
+            def load(wsc):
+                wsc.load_html(size, html)
+                wsc.get_list_from_headline(STAFF_HEADLINE)
+                wsc.get_table('infobox')
+            def parse_only(wsc):
+                wsc.load_html(size, html)
+            setup = lambda: WikiScraper(parser=parser)
+            with redirect_stdout(io.StringIO()):
+                results['scraper.load.'+parser+'.'+size] = measure(load, repeat, setup)
+                results['scraper.load_html.'+parser+'.'+size] = measure(parse_only, repeat, setup)
+    return results
+
+# benchmarks of create_graph, merge_genre and reduce_node on synthetic profiles
+def graph_benchmarks(sizes, repeat):
+    from graph import create_graph, merge_genre, reduce_node, prune_graph
+    from compact_graph import CompactGraph
+    from synthetic import synthetic_input
+    results = {}
+    for size in sizes:
+        input = synthetic_input(size)
+        G = create_graph(input, merge=False)
+        merged = merge_genre(G)
+        nodes, edges = dict(merged.nodes), list(merged.edges)
+        max_nodes = max(size, len(merged) // 4)
+        # reduce_node is slow and prints each step
+        reduce_repeat = repeat if size <= 1000 else 1
+        results['graph.create_graph.'+str(size)] = measure(lambda: create_graph(input, merge=False), repeat)
+        results['graph.merge_genre.'+str(size)] = measure(lambda: merge_genre(G), repeat)
+        with redirect_stdout(io.StringIO()):
+            results['graph.reduce_node.'+str(size)] = measure(lambda: reduce_node(merged, max_nodes), reduce_repeat)
+        results['graph.prune_graph.'+str(size)] = measure(lambda: prune_graph(nodes, edges, max_nodes=max_nodes), repeat)
+        results['graph.compact.'+str(size)] = measure(lambda: CompactGraph.from_input(input), repeat)
+    return results
+
+# benchmarks of ElasticUtil and ElasticUtilNameId against the in-memory stand-in
+def elastic_benchmarks(repeat, docs=ES_DOCS):
+    from elastic_util import ElasticUtil, ElasticUtilNameId, ID_MODES
+    from es_stub import InMemoryElasticsearch
+    from synthetic import synthetic_input, synthetic_user
+    logging.getLogger().setLevel(logging.CRITICAL) # missing and existing contents are logged as errors
+    results = {}
+    contents = synthetic_input(docs)
+    names = list(contents)
+    lookup = names[::max(1, docs // 100)][:100]
+    for id_mode in ID_MODES:
+        es = InMemoryElasticsearch()
+        eu = ElasticUtilNameId(index='contents', id_mode=id_mode, client=es)
+        eu.bulk_post({name: dict(c['data'], name=name) for name, c in contents.items()})
+        prefix = 'elastic.'+id_mode+'.'
+        results[prefix+'get'] = measure(lambda: [eu.get(name) for name in lookup], repeat)
+        results[prefix+'get_list'] = measure(lambda: eu.get_list(lookup), repeat)
+        results[prefix+'get_page'] = measure(lambda: eu.get_page(size=100), repeat)
+        results[prefix+'scan'] = measure(lambda: list(eu.scan()), repeat)
+        bodies = {name: dict(contents[name]['data'], name=name) for name in lookup}
+        results[prefix+'bulk_post'] = measure(lambda: eu.bulk_post(bodies, overwrite=True), repeat)
+        results[prefix+'put'] = measure(lambda: [eu.put(name, contents[name]['data']) for name in lookup], repeat)
+
+    es = InMemoryElasticsearch()
+    eu_user = ElasticUtil(index='users', client=es)
+    user = synthetic_user(100)
+    results['elastic.users.put'] = measure(lambda: eu_user.put('user', user), repeat)
+    results['elastic.users.get'] = measure(lambda: eu_user.get('user'), repeat)
+    logging.getLogger().setLevel(logging.INFO)
+    return results
+
+def run(sizes=SIZES, repeat=REPEAT, filter=''):
+    suites = {
+        'scraper': lambda: scraper_benchmarks(repeat),
+        'graph': lambda: graph_benchmarks(sizes, repeat),
+        'elastic': lambda: elastic_benchmarks(repeat),
+    }
+    results = {}
+    for name, suite in suites.items():
+        if filter and not name.startswith(filter):
+            continue
+        logging.info('benchmark '+name)
+        results.update(suite())
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': sizes,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+# compare medians of two results. return list of (name, base, new, ratio, regressed)
+def compare(base, new, threshold=THRESHOLD):
+    rows = []
+    for name in sorted(set(base['results']) & set(new['results'])):
+        b = base['results'][name]['median']
+        n = new['results'][name]['median']
+        ratio = n / b if b > 0 else float('inf')
+        rows.append((name, b, n, ratio, ratio > 1 + threshold))
+    return rows
+
+def print_results(results):
+    for name, r in sorted(results['results'].items()):
+        print('{:45s} {:12.3f} ms'.format(name, r['median']*1000))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='offline micro-benchmarks')
+    parser.add_argument('--output', help='json file to write the results')
+    parser.add_argument('--compare', help='json file of the base results. exit 1 on regression')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='number of contents of graph benchmarks')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--filter', default='', help='run only suites starting with this, e.g. graph')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not args.compare:
+        print_results(results)
+        sys.exit(0)
+
+    with open(args.compare) as f:
+        base = json.load(f)
+    regressions = 0
+    for name, b, n, ratio, regressed in compare(base, results, args.threshold):
+        regressions += regressed
+        print('{:45s} {:10.3f} ms {:10.3f} ms {:6.2f}x {}'.format(name, b*1000, n*1000, ratio, 'REGRESSION' if regressed else ''))
+    print(str(regressions)+' regressions over '+str(int(args.threshold*100))+'%')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bulk content ingestion shared by /contents/bulk and the command line
+# usage: python bulk.py test_data/contents.csv --workers 8
+
+import os
+import csv
+import json
+import argparse
+import logging
+logging.basicConfig(level=logging.INFO)
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from elastic_util import ElasticUtilNameId, es_params_from_env, BULK_CHUNK_SIZE
+from wikiscraper import wiki_load
+from graph import graph_view_field, VIEW_MAPPING
+
+SCRAPE_WORKERS = 4
+NAME_COLUMNS = ['name', 'title', 'タイトル']
+WIKI_ID_COLUMNS = ['wiki_id', 'id']
+
+# read items from csv text
+# the name column is one of NAME_COLUMNS or the first column
+# wiki id and json data columns are optional
+def items_from_csv(text):
+    rows = list(csv.reader(text.splitlines()))
+    if len(rows)==0:
+        return []
+    header = [h.strip() for h in rows[0]]
+    name_col = next((header.index(c) for c in NAME_COLUMNS if c in header), 0)
+    wiki_id_col = next((header.index(c) for c in WIKI_ID_COLUMNS if c in header), None)
+    data_col = header.index('data') if 'data' in header else None
+
+    items = []
+    for row in rows[1:]:
+        if len(row)==0:
+            continue
+        item = {'name': row[name_col].strip()}
+        if wiki_id_col is not None and wiki_id_col < len(row) and row[wiki_id_col].strip():
+            item['wiki_id'] = row[wiki_id_col].strip()
+        if data_col is not None and data_col < len(row) and row[data_col].strip():
+            item['data'] = row[data_col]
+        items.append(item)
+    return items
+
+# check and normalize one item
+# return (name, wiki_id, data), '' or None, error message
+def parse_item(item):
+    if type(item)!=dict or not item.get('name'):
+        return None, 'Item must be dictionary with name'
+    wiki_id = item.get('wiki_id', -1)
+    try:
+        wiki_id = int(float(wiki_id))
+    except (TypeError, ValueError):
+        return None, 'Invalid wiki_id: '+str(wiki_id)
+    if wiki_id < 0:
+        wiki_id = np.nan
+
+    data = item.get('data', {})
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return None, 'Invalid data: '+data
+    if type(data)!=dict:
+        return None, 'Body must be dictionary'
+    return (item['name'], wiki_id, data), ''
+
+# create contents from the list of items
+# items: list of dict with name, optional wiki_id and data. data is scraped from wikipedia if empty
+# overwrite: update existing contents instead of skipping them
+# return list of dict with name, code and msg in the order of items
+def bulk_load(eu_content, items, overwrite=False, workers=SCRAPE_WORKERS, chunk_size=BULK_CHUNK_SIZE):
+    report = {}
+    order = []
+    parsed = {}
+    for item in items:
+        res, msg = parse_item(item)
+        name = item.get('name') if type(item)==dict else None
+        if res is None:
+            order.append(None)
+            report[len(order)-1] = {'name': name, 'code': 400, 'msg': msg}
+            continue
+        if res[0] in parsed:
+            order.append(None)
+            report[len(order)-1] = {'name': name, 'code': 400, 'msg': name+' is duplicated in the request'}
+            continue
+        order.append(res[0])
+        parsed[res[0]] = res
+
+    # skip existing contents before scraping
+    res, code = eu_content.get_list(parsed.keys())
+    existing = res['found']
+    bodies = {}
+    results = {}
+    for name in res['duplicates']:
+        results[name] = ('There are multiple contents with same name: ' + name + '. Please fix the data', 500)
+    to_scrape = []
+    for name, wiki_id, data in parsed.values():
+        if name in results:
+            continue
+        if name in existing and not overwrite:
+            results[name] = (name+' is exist', 400)
+        elif data=={}:
+            to_scrape.append((name, wiki_id))
+        else:
+            bodies[name] = data
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        scraped = executor.map(lambda args: wiki_load(*args), to_scrape)
+        for (name, wiki_id), (res, code) in zip(to_scrape, scraped):
+            if code==200:
+                bodies[name] = res
+            else:
+                results[name] = (res, code)
+
+    results.update(eu_content.bulk_post(bodies, overwrite=overwrite, existing=existing, chunk_size=chunk_size))
+
+    output = []
+    for i, name in enumerate(order):
+        if name is None:
+            output.append(report[i])
+            continue
+        res, code = results[name]
+        output.append({'name': name, 'code': code, 'msg': res if isinstance(res, str) else res.get('result', '')})
+    return output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='create contents from csv or json list')
+    parser.add_argument('file', help='csv file or json file with list of {name, wiki_id, data}')
+    parser.add_argument('--overwrite', action='store_true', help='update existing contents')
+    parser.add_argument('--workers', type=int, default=SCRAPE_WORKERS, help='number of concurrent wikipedia scrapes')
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help='number of documents in one bulk request')
+    parser.add_argument('--index', default=os.environ.get('ELASTIC_CONTENTS_INDEX', 'contents'))
+    parser.add_argument('--id-mode', default=os.environ.get('ELASTIC_CONTENTS_ID_MODE', 'search'))
+    parser.add_argument('--layout', default=os.environ.get('ELASTIC_CONTENTS_LAYOUT', 'raw'))
+    args = parser.parse_args()
+
+    with open(args.file, encoding='utf-8') as f:
+        text = f.read()
+    if args.file.endswith('.json'):
+        items = json.loads(text)
+    else:
+        items = items_from_csv(text)
+
+    eu_content = ElasticUtilNameId(index=args.index, id_mode=args.id_mode, view=graph_view_field, layout=args.layout,
+                                   mappings=VIEW_MAPPING, **es_params_from_env())
+    output = bulk_load(eu_content, items, overwrite=args.overwrite, workers=args.workers, chunk_size=args.chunk_size)
+    for res in output:
+        print(json.dumps(res, ensure_ascii=False))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# array based graph of contents and attributes
+# node names are interned to int ids, points and genres are numpy arrays
+# and edges are COO arrays with relation ids
+# usage to compare time and memory with create_graph:
+#   python compact_graph.py --sizes 100 1000 10000
+# parity with create_graph: python -m pytest -q test_compact_graph.py
+
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+from graph import create_graph, content_view, merge_genre_name, count_once
+
+GENRE_CONTENT = 0
+GENRE_ATTRIBUTE = 1
+
+# hashable key of genre. genre is an empty list if ジャンル of the content is empty
+def genre_key(genre):
+    return genre if isinstance(genre, str) else ()
+
+class CompactGraph(object):
+    def __init__(self):
+        self.names = [] # node id: name
+        self.ids = {} # name: node id
+        self.points = np.zeros(0)
+        self.genres = np.zeros(0, dtype=np.int32) # node id: genre id
+        self.genre_names = ['content', 'attribute'] # genre id: genre
+        self.src = np.zeros(0, dtype=np.int32) # content node id of edge
+        self.dst = np.zeros(0, dtype=np.int32) # attribute node id of edge
+        self.relations = np.zeros(0, dtype=np.int32) # relation id of edge
+        self.relation_names = [] # relation id: relation
+
+    def __len__(self):
+        return len(self.names)
+
+    # same graph as create_graph
+    # input: output of pre_create_graph
+    @classmethod
+    def from_input(cls, input, merge=True):
+        cg = cls()
+        names, ids = cg.names, cg.ids
+        genre_ids = {'content': GENRE_CONTENT, 'attribute': GENRE_ATTRIBUTE}
+        relation_ids = {}
+        content_points = []
+        content_genres = [] # (node id, genre id)
+        src, dst, rel, weight = [], [], [], []
+
+        def intern(name):
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+            return ids[name]
+
+        for name in input:
+            point = input[name]['point']
+            node = intern(name)
+            genre, attrs = content_view(input[name]['data'], merge=False)
+            key = genre_key(genre)
+            if key not in genre_ids:
+                genre_ids[key] = len(cg.genre_names)
+                cg.genre_names.append(genre)
+            content_points.append((node, point))
+            content_genres.append((node, genre_ids[key]))
+            for attr, relation, count in attrs:
+                if attr in input: #do nothing for contents itself
+                    continue
+                if relation not in relation_ids:
+                    relation_ids[relation] = len(cg.relation_names)
+                    cg.relation_names.append(relation)
+                src.append(node)
+                dst.append(intern(attr))
+                rel.append(relation_ids[relation])
+                weight.append(point if count_once else point * count)
+
+        n = len(names)
+        cg.src = np.array(src, dtype=np.int32)
+        cg.dst = np.array(dst, dtype=np.int32)
+        cg.relations = np.array(rel, dtype=np.int32)
+        # accumulate attribute points in one pass
+        cg.points = np.bincount(cg.dst, weights=np.array(weight, dtype=np.float64), minlength=n).astype(np.float64)
+        cg.genres = np.full(n, GENRE_ATTRIBUTE, dtype=np.int32)
+        if len(content_points):
+            nodes, points = zip(*content_points)
+            cg.points[list(nodes)] = points
+            nodes, genres = zip(*content_genres)
+            cg.genres[list(nodes)] = genres
+        if merge:
+            cg.merge_genre()
+        return cg
+
+    # merge the closed genres on the genre table, not per node
+    def merge_genre(self):
+        table = {}
+        genre_names = []
+        mapping = np.zeros(len(self.genre_names), dtype=np.int32)
+        for i, genre in enumerate(self.genre_names):
+            merged = genre if i == GENRE_ATTRIBUTE else merge_genre_name(genre)
+            key = genre_key(merged)
+            if key not in table:
+                table[key] = len(genre_names)
+                genre_names.append(merged)
+            mapping[i] = table[key]
+        self.genre_names = genre_names
+        self.genres = mapping[self.genres]
+
+    def degrees(self):
+        return np.bincount(self.src, minlength=len(self)) + np.bincount(self.dst, minlength=len(self))
+
+    # symmetric adjacency in CSR. return indptr and indices
+    def csr(self):
+        n = len(self)
+        rows = np.concatenate([self.src, self.dst])
+        cols = np.concatenate([self.dst, self.src])
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return indptr, cols[order]
+
+    # same as dict(G.nodes) of create_graph
+    def nodes_dict(self):
+        genre_names = self.genre_names
+        return {name: {'genre': genre_names[g], 'point': p}
+                for name, g, p in zip(self.names, self.genres.tolist(), self.points.tolist())}
+
+    # order of edges of G.edges of create_graph
+    # networkx reports an edge at the endpoint added first, in the order the edges were added
+    def _edge_order(self):
+        lo = np.minimum(self.src, self.dst)
+        return np.lexsort((np.arange(len(lo)), lo))
+
+    # list of edges in the order of G.edges of create_graph
+    def edge_list(self):
+        order = self._edge_order()
+        lo = np.minimum(self.src, self.dst)[order]
+        hi = np.maximum(self.src, self.dst)[order]
+        names = self.names
+        return [(names[u], names[v]) for u, v in zip(lo.tolist(), hi.tolist())]
+
+    # relation of each edge of edge_list
+    def edge_relations(self):
+        relation_names = self.relation_names
+        return [relation_names[r] for r in self.relations[self._edge_order()].tolist()]
+
+    # networkx graph for compatibility
+    def to_networkx(self):
+        G = nx.Graph()
+        genre_names = self.genre_names
+        for name, g, p in zip(self.names, self.genres.tolist(), self.points.tolist()):
+            G.add_node(name, genre=genre_names[g], point=p)
+        names = self.names
+        relation_names = self.relation_names
+        for u, v, r in zip(self.src.tolist(), self.dst.tolist(), self.relations.tolist()):
+            G.add_edge(names[u], names[v], relation=relation_names[r])
+        return G
+
+    # approximate bytes of the arrays and name tables
+    def nbytes(self):
+        arrays = [self.points, self.genres, self.src, self.dst, self.relations]
+        return sum(a.nbytes for a in arrays) + sum(len(n.encode('utf-8')) + 49 for n in self.names)
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = func()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, elapsed, peak
+
+if __name__ == "__main__":
+    from synthetic import synthetic_input
+    from incremental_graph import graph_diff
+
+    parser = argparse.ArgumentParser(description='compare CompactGraph with create_graph')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print('contents nodes edges  networkx[ms] compact[ms]  networkx[MB] compact[MB]  same')
+    for size in args.sizes:
+        input = synthetic_input(size)
+        G, t_nx, m_nx = measure(lambda: create_graph(input))
+        cg, t_cg, m_cg = measure(lambda: CompactGraph.from_input(input))
+        same = cg.nodes_dict() == dict(G.nodes) and cg.edge_list() == list(G.edges) and not graph_diff(cg.to_networkx(), G)
+        print('{:8d} {:5d} {:6d}  {:12.1f} {:11.1f}  {:12.2f} {:11.2f}  {}'.format(
+            size, len(cg), len(cg.src), t_nx*1000, t_cg*1000, m_nx/1e6, m_cg/1e6, same))
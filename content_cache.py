@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# LRU cache of content documents by name, filled on read by ElasticUtilNameId
+# entries keep _seq_no and _primary_term. entries older than verify_after are served
+# only after a batched version check, which bounds staleness for writes of other processes
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+CONTENT_CACHE_MAX_BYTES = 32*1024*1024
+CONTENT_CACHE_VERIFY_AFTER = 5.0 # seconds an entry is served without a version check
+
+# (primary term, seq no) of the document. None if the document has no sequence number
+def doc_version(doc):
+    if doc.get('_seq_no') is None:
+        return None
+    return (doc.get('_primary_term') or 0, doc['_seq_no'])
+
+class ContentCache(object):
+    # max_bytes: total json size of cached _source
+    # verify_after: seconds until an entry needs a version check. always checked if 0
+    def __init__(self, max_bytes=CONTENT_CACHE_MAX_BYTES, verify_after=CONTENT_CACHE_VERIFY_AFTER):
+        self._max_bytes = max_bytes
+        self._verify_after = verify_after
+        self._entries = OrderedDict() # name: (document, size, verified time)
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    # counter of writes. pass it to put to drop documents read before a write
+    def generation(self):
+        return self._generation
+
+    # split names into fresh documents and documents which need a version check
+    # names in neither are not cached. documents are shared, do not modify them
+    def lookup(self, names):
+        now = time.time()
+        fresh = {}
+        unverified = {}
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(name)
+                if now - entry[2] < self._verify_after:
+                    self.hits += 1
+                    fresh[name] = entry[0]
+                else:
+                    unverified[name] = entry[0]
+        return fresh, unverified
+
+    # fresh document of name or None. an entry which needs a version check is a miss
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or time.time() - entry[2] >= self._verify_after:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry[0]
+
+    # result of the version check of names returned as unverified by lookup
+    # versions: dict of name: current (primary term, seq no). names not in versions are removed
+    def confirm(self, versions, names):
+        now = time.time()
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                if entry is None:
+                    continue
+                self.verified += 1
+                if name in versions and versions[name] == doc_version(entry[0]):
+                    self._entries[name] = (entry[0], entry[1], now)
+                    self.hits += 1
+                else:
+                    self._remove(name)
+                    self.stale += 1
+                    self.misses += 1
+
+    # document: hit or get response with _source, _seq_no and _primary_term
+    # generation: value of generation() before reading the document
+    def put(self, name, document, generation=None):
+        size = len(json.dumps(document.get('_source'), ensure_ascii=False, default=str))
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._set(name, document, size)
+
+    # document written by this process. replaces the entry and drops reads in flight
+    def update(self, name, document):
+        size = len(json.dumps(document.get('_source'), ensure_ascii=False, default=str))
+        with self._lock:
+            self._generation += 1
+            if name in self._entries:
+                self._remove(name)
+            if size <= self._max_bytes:
+                self._set(name, document, size)
+
+    def _set(self, name, document, size):
+        old = self._entries.get(name)
+        if old is not None:
+            old_version, new_version = doc_version(old[0]), doc_version(document)
+            if old_version is not None and new_version is not None and new_version < old_version:
+                return
+            self._remove(name)
+        self._entries[name] = (document, size, time.time())
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, name):
+        document, size, verified = self._entries.pop(name)
+        self._bytes -= size
+
+    def invalidate(self, name):
+        with self._lock:
+            self._generation += 1
+            if name in self._entries:
+                self._remove(name)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'verified': self.verified,
+            'stale': self.stale,
+            'invalidations': self.invalidations,
+        }
+
+# cache configured by CONTENT_CACHE_MAX_BYTES and CONTENT_CACHE_VERIFY_AFTER environment variables
+# None if CONTENT_CACHE_MAX_BYTES is 0
+def content_cache_from_env():
+    max_bytes = int(os.environ.get('CONTENT_CACHE_MAX_BYTES', CONTENT_CACHE_MAX_BYTES))
+    if max_bytes <= 0:
+        return None
+    return ContentCache(max_bytes=max_bytes,
+                        verify_after=float(os.environ.get('CONTENT_CACHE_VERIFY_AFTER', CONTENT_CACHE_VERIFY_AFTER)))
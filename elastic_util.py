@@ -1,52 +1,256 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import copy
+import json
+import uuid
+import base64
+import hashlib
+import time
 import logging
+import threading
 logging.basicConfig(level=logging.INFO)
 
-from elasticsearch import Elasticsearch
-from elasticsearch.client import IndicesClient
-from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch import Elasticsearch, Transport, helpers
+from elasticsearch.exceptions import NotFoundError, RequestError, ConflictError, TransportError, ConnectionError as ESConnectionError
+from metrics import stage, count_es_request
+from content_cache import doc_version
 
 # es = Elasticsearch()
 
 INDEX_NAMES = ['contents', 'users']
+GET_LIST_CHUNK_SIZE = 1000 # number of names in one terms query
+GET_LIST_MAX_HITS = 10000 # default index.max_result_window
+# how ElasticUtilNameId finds the document of a name
+# search: term search on name.keyword (near-realtime, legacy layout)
+# name: document _id is made from the name (realtime get, no duplicates)
+ID_MODES = ['search', 'name']
+PAGE_SIZE = 100 # default number of documents in one page of get_page
+MAX_PAGE_SIZE = 1000
+# keyword copy of the document _id in _source. sorting on _id needs fielddata of all ids on the heap
+# documents written before it existed get it by `python migrate.py doc_id`
+ID_FIELD = 'doc_id'
+ID_MAPPING = {ID_FIELD: {"type": "keyword"}}
+PAGE_SORT = [{ID_FIELD: 'asc'}] # unique sort key with doc values for search_after
+BULK_CHUNK_SIZE = 500 # number of documents in one bulk request
+POOL_MAXSIZE = 10 # connections kept per host in each process
+# how ElasticUtilNameId stores the attributes of a content
+# raw: each role is a top-level field (dynamic mapping, one field per role name)
+# flat: roles are keys of one flattened field. the index is created from contents_template
+#       the flattened type needs elasticsearch 7.3 or later with the default distribution (x-pack), not the oss one
+LAYOUTS = ['raw', 'flat']
+ATTRIBUTES_FIELD = 'attributes'
+AGG_MAX_TERMS = 65536 # max buckets of aggregate. default search.max_buckets counts sub buckets too
+MAPPING_TTL = 60 # seconds to keep the result of the mapping check of aggregate
+
+# connection parameters from ELASTIC_* environment variables
+def es_params_from_env():
+    return {
+        'host': os.environ.get('ELASTIC_HOST', 'localhost'),
+        'port': os.environ.get('ELASTIC_PORT', 9200),
+        'scheme': os.environ.get('ELASTIC_SCHEME', 'http'),
+        'http_auth': (os.environ.get('ELASTIC_USER', ''), os.environ.get('ELASTIC_PASS', '')),
+        'maxsize': int(os.environ.get('ELASTIC_MAXSIZE', POOL_MAXSIZE)),
+    }
+
+# stable document id for content name
+def name_to_id(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()
+
+# id of a new document without a name. made here instead of by elasticsearch so that it is stored in ID_FIELD
+def new_id():
+    return uuid.uuid4().hex
+
+# _source without ID_FIELD as returned to the caller
+def without_id(source):
+    if ID_FIELD not in source:
+        return source
+    return {k: v for k, v in source.items() if k != ID_FIELD}
+
+# opaque cursor string from sort values of the last hit
+def encode_cursor(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+
+# legacy index template (indices.put_template) of the flat layout
+# composable templates (put_index_template) need elasticsearch-py 7.8, the client is pinned to 7.6
+# only name, the flattened attributes and properties are mapped. other top-level fields are kept in _source
+# properties: mappings of other fields like the graph view
+def contents_template(index, field_limit=5000, properties=None):
+    template = {
+        "index_patterns": [index],
+        "settings": {
+            "index.mapping.total_fields.limit": field_limit
+        },
+        "mappings": {
+            "dynamic": False,
+            "properties": dict(ID_MAPPING, **{
+                "name": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+                ATTRIBUTES_FIELD: {"type": "flattened"}
+            })
+        }
+    }
+    template['mappings']['properties'].update(properties or {})
+    return template
+
+# _source of the flat layout. keys in top_level stay top-level fields, others go to ATTRIBUTES_FIELD
+def flatten_source(source, top_level=('name',)):
+    stored = {ATTRIBUTES_FIELD: {k: v for k, v in source.items() if k not in top_level}}
+    for k in top_level:
+        if k in source:
+            stored[k] = source[k]
+    return stored
+
+# _source of the raw layout from the flat layout. attributes come first like scraped data
+def unflatten_source(stored):
+    source = dict(stored.get(ATTRIBUTES_FIELD, {}))
+    for k, v in stored.items():
+        if k != ATTRIBUTES_FIELD:
+            source[k] = v
+    return source
+
+# transport which records time and number of round trips in metrics
+class TimedTransport(Transport):
+    def perform_request(self, *args, **kwargs):
+        count_es_request()
+        with stage('elasticsearch'):
+            return super().perform_request(*args, **kwargs)
 
 class ElasticUtil(object):
-    def __init__(self, index, host='localhost', port=9200, scheme='https', http_auth=('elastic', ''), doc_type='_doc', field_limit=5000):
-        self._client = Elasticsearch(host=host, port=port, scheme=scheme, http_auth=http_auth)
+    # bootstrap: check and create the index now. the client connects at the first request otherwise
+    # maxsize: number of connections in the pool of the client
+    # client: client to use instead of connecting to host, like es_stub.InMemoryElasticsearch
+    def __init__(self, index, host='localhost', port=9200, scheme='https', http_auth=('elastic', ''), doc_type='_doc', field_limit=5000,
+                 bootstrap=True, maxsize=POOL_MAXSIZE, client=None):
+        self._es_params = {'host': host, 'port': port, 'scheme': scheme, 'http_auth': http_auth, 'maxsize': maxsize,
+                           'transport_class': TimedTransport}
+        self._es = client
+        self._es_given = client is not None
+        self._es_pid = None
+        self._es_lock = threading.Lock()
         self._doc_type = doc_type
         self._index = index
+        self._field_limit = field_limit
+        self._listeners = []
+        if bootstrap:
+            self.bootstrap()
+
+    # client created at the first use in each process
+    # so that forked workers do not share the connections of the parent
+    @property
+    def _client(self):
+        if self._es_given:
+            return self._es
+        if self._es is None or self._es_pid != os.getpid():
+            with self._es_lock:
+                if self._es is None or self._es_pid != os.getpid():
+                    self._es = Elasticsearch(**self._es_params)
+                    self._es_pid = os.getpid()
+        return self._es
 
-        self._index_client = IndicesClient(self._client) 
-        if self._index_client.exists(index=self._index):
+    # use client instead of connecting to host from now on
+    def set_client(self, client):
+        with self._es_lock:
+            self._es = client
+            self._es_given = True
+
+    # create the index if it does not exist
+    # the explicit mappings are added to an existing index. fields already mapped otherwise are logged
+    def bootstrap(self):
+        index_client = self._client.indices
+        body = {
+            "settings": {
+                "index.mapping.total_fields.limit": self._field_limit
+            },
+            "mappings": {
+                "properties": self._properties()
+            }
+        }
+        if index_client.exists(index=self._index):
             logging.warning('index name:'+self._index+' exists')
+            try:
+                index_client.put_mapping(index=self._index, body=body['mappings'])
+            except RequestError as err:
+                logging.error('mappings of '+self._index+' can not be updated, reindex it: '+str(err))
         else:
             logging.info('create index name:'+self._index)
-            body = {
-                "settings": {
-                    "index.mapping.total_fields.limit": field_limit
-                },
-            }
-            self._index_client.create(index=self._index)
+            index_client.create(index=self._index, body=body)
+
+    # explicit mappings of the index
+    def _properties(self):
+        return dict(ID_MAPPING)
+
+    # callback(key) is called after a document is created or updated
+    # key is the document id, or the name for ElasticUtilNameId
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, key):
+        for callback in self._listeners:
+            callback(key)
 
     def get(self, id):
         exists = self._client.exists(index=self._index, id=id)
         if exists:
             res = self._client.get(index=self._index, id=id)
-            return res, 200
+            return self._from_stored(res), 200
         else:
             logging.error(id+' not found')
             return False, 404
 
+    # get all documents. use get_page or scan for large index
     def get_all(self):
+        return list(self.scan()), 200
+
+    # get one page of documents sorted by the document id
+    # size: number of documents
+    # cursor: next cursor returned by previous page
+    # return dict of hits and next cursor (None if this is the last page)
+    def get_page(self, size=PAGE_SIZE, cursor=None):
+        if size < 1 or size > MAX_PAGE_SIZE:
+            msg = 'size must be between 1 and '+str(MAX_PAGE_SIZE)
+            logging.error(msg)
+            return msg, 400
+
+        search_query = {
+            "size": size,
+            "query": {
+                "match_all": {}
+            },
+            "sort": PAGE_SORT
+        }
+        if cursor:
+            try:
+                search_query['search_after'] = decode_cursor(cursor)
+            except ValueError:
+                msg = 'Invalid cursor: '+cursor
+                logging.error(msg)
+                return msg, 400
+
+        hits = [self._from_stored(hit) for hit in self._client.search(index=self._index, body=search_query)['hits']['hits']]
+        next_cursor = None
+        if len(hits) == size:
+            next_cursor = encode_cursor(hits[-1]['sort'])
+        return {'hits': hits, 'next': next_cursor}, 200
+
+    # iterate all documents with scroll without building the whole list
+    def scan(self):
         search_query = {
             "query": {
                 "match_all": {}
             }
         }
-        res = self._client.search(index=self._index, body=search_query)
-        return res['hits']['hits'], 200
+        for doc in helpers.scan(self._client, index=self._index, query=search_query):
+            yield self._from_stored(doc)
+
+    # document as returned to the caller from the document in elasticsearch
+    def _from_stored(self, doc):
+        if ID_FIELD not in doc.get('_source', {}):
+            return doc
+        return dict(doc, _source=without_id(doc['_source']))
 
     def post(self, body={}):
         if type(body)!=dict:
@@ -79,8 +283,10 @@ class ElasticUtil(object):
         #                      "飛び出せ!科学くん": {"point": 0.5, "checked": 1.0, "id": -1.0},
         #                      "ラブレターズのオールナイトニッポン0(ZERO)": {"point": 0.6, "checked": 1.0, "id": -1.0}
         #                      }
-        res = self._client.index(index=self._index, body=res_dict, doc_type=self._doc_type)
+        id = new_id()
+        res = self._client.index(id=id, index=self._index, body=dict(res_dict, **{ID_FIELD: id}), doc_type=self._doc_type)
         logging.info('id: '+res['_id']+' was created')
+        self._notify(res['_id'])
         return res, 201
 
     def put(self, id, body={}): 
@@ -90,20 +296,54 @@ class ElasticUtil(object):
             return msg, 400
 
         exist = self._client.exists(index=self._index, id=id)
-        res = self._client.index(id=id, index=self._index, body=body, doc_type=self._doc_type)
+        res = self._client.index(id=id, index=self._index, body=dict(body, **{ID_FIELD: id}), doc_type=self._doc_type)
         if exist:
             logging.info(id+' was updated')            
+            self._notify(id)
         else:
             logging.info(id+' was created')            
+            self._notify(id)
 
         return res, 200
 
 class ElasticUtilNameId(ElasticUtil):
-    def __init__(self, index, host='localhost', port=9200, scheme='https', http_auth=('elastic', ''), doc_type='_doc', field_limit=5000):
-        super().__init__(index, host=host, port=port, scheme=scheme, http_auth=http_auth, doc_type=doc_type, field_limit=field_limit)
+    # cache: ContentCache of documents by name. filled by get and get_list, updated by writes of this instance
+    # view: function of the body returning dict of fields stored with written documents, like the graph view
+    # layout: one of LAYOUTS. documents are read and written as raw dicts in both layouts
+    # mappings: explicit properties of the index in both layouts, like graph.VIEW_MAPPING
+    def __init__(self, index, host='localhost', port=9200, scheme='https', http_auth=('elastic', ''), doc_type='_doc', field_limit=5000, id_mode='search',
+                 bootstrap=True, maxsize=POOL_MAXSIZE, client=None, cache=None, view=None, layout='raw', mappings=None):
+        if id_mode not in ID_MODES:
+            raise ValueError('id_mode must be one of '+', '.join(ID_MODES))
+        if layout not in LAYOUTS:
+            raise ValueError('layout must be one of '+', '.join(LAYOUTS))
+        self._id_mode = id_mode
+        self._cache = cache
+        self._view = view
+        self._layout = layout
+        self._mappings = mappings
+        self._keyword_fields = {} # field: (aggregatable field or None, checked time)
+        super().__init__(index, host=host, port=port, scheme=scheme, http_auth=http_auth, doc_type=doc_type, field_limit=field_limit,
+                         bootstrap=bootstrap, maxsize=maxsize, client=client)
+
+    # mappings like graph.VIEW_MAPPING are explicit in both layouts
+    def _properties(self):
+        return dict(super()._properties(), **(self._mappings or {}))
+
+    # put the index template of the flat layout before the index is created
+    def bootstrap(self):
+        if self._layout == 'flat':
+            self._client.indices.put_template(name=self._index,
+                                              body=contents_template(self._index, self._field_limit, self._mappings))
+        super().bootstrap()
+
+    def _from_stored(self, doc):
+        if self._layout == 'raw':
+            return super()._from_stored(doc)
+        return dict(doc, _source=without_id(unflatten_source(doc['_source'])))
 
     def name_check(self, name):
-        if name is '':
+        if name == '':
             msg = 'Empty name is not allowed'
             logging.error(msg)
             return msg, 400
@@ -111,7 +351,28 @@ class ElasticUtilNameId(ElasticUtil):
             return '', 200
 
     def get(self, name):
+        if self._cache is None:
+            return self._get(name)
+        doc = self._cache.get(name)
+        if doc is not None:
+            return doc, 200
+        generation = self._cache.generation()
+        res, code = self._get(name)
+        if code == 200:
+            self._cache.put(name, res, generation)
+        return res, code
+
+    def _get(self, name):
+        res, code = self._get_by_id(name) if self._id_mode == 'name' else self._search_name(name)
+        if code == 200:
+            res = self._from_stored(res)
+        return res, code
+
+    def _search_name(self, name):
+
         search_query = {
+          "version": True,
+          "seq_no_primary_term": True,
           "query": {
             "term": {
               "name.keyword": name
@@ -133,39 +394,272 @@ class ElasticUtilNameId(ElasticUtil):
         else:
             return res[0], 200
 
-    def get_list(self, names):
-        res = []
-        for name in names:
-            res.append(self.get(name))[0]
+    # realtime get with the document id made from name
+    def _get_by_id(self, name):
+        try:
+            res = self._client.get(index=self._index, id=name_to_id(name))
+        except NotFoundError:
+            msg = name+' not found'
+            logging.error(msg)
+            return msg, 404
         return res, 200
 
-    def get_all(self):
+    # get multiple contents with one terms query (or mget) per chunk of names
+    # cached contents are served after one batched version check if they are not fresh
+    # names: list of content names
+    # return dict of found (name: document), missing names and duplicated names
+    def get_list(self, names, chunk_size=GET_LIST_CHUNK_SIZE):
+        names = list(dict.fromkeys(names)) # remove duplicated input but keep order
+        cached = {}
+        if self._cache is not None:
+            generation = self._cache.generation()
+            cached, unverified = self._cache.lookup(names)
+            if len(unverified):
+                versions = self._versions(list(unverified), chunk_size)
+                self._cache.confirm(versions, unverified)
+                for name, doc in unverified.items():
+                    if name in versions and versions[name] == doc_version(doc):
+                        cached[name] = doc
+
+        found, duplicates = self._fetch_list([name for name in names if name not in cached], chunk_size)
+        if self._cache is not None:
+            for name, doc in found.items():
+                self._cache.put(name, doc, generation)
+        found.update(cached)
+        missing = [name for name in names if name not in found and name not in duplicates]
+        if len(missing):
+            logging.error(str(len(missing))+' contents not found: '+', '.join(missing))
+
+        res = {
+            'found': found,
+            'missing': missing,
+            'duplicates': duplicates
+        }
+        return res, 200
+
+    # found (name: document) and duplicated names from elasticsearch
+    def _fetch_list(self, names, chunk_size):
+        found = {}
+        duplicates = []
+        for i in range(0, len(names), chunk_size):
+            if self._id_mode == 'name':
+                found.update(self._mget_by_id(names[i:i+chunk_size]))
+                continue
+            chunk = names[i:i+chunk_size]
+            search_query = {
+                "size": GET_LIST_MAX_HITS,
+                "version": True,
+                "seq_no_primary_term": True,
+                "query": {
+                    "terms": {
+                        "name.keyword": chunk
+                    }
+                }
+            }
+            hits = self._client.search(index=self._index, body=search_query)['hits']['hits']
+            if len(hits) >= GET_LIST_MAX_HITS:
+                logging.error('get_list hits reached the limit: '+str(GET_LIST_MAX_HITS)+'. Some contents may be missing')
+            for hit in hits:
+                name = hit['_source'].get('name')
+                if name in found:
+                    if name not in duplicates:
+                        duplicates.append(name)
+                else:
+                    found[name] = hit
+
+        for name in duplicates:
+            msg = 'There are multiple contents with same name: ' + name + '. Please fix the data'
+            logging.error(msg)
+            del found[name]
+        return {name: self._from_stored(doc) for name, doc in found.items()}, duplicates
+
+    def _mget_by_id(self, names, **kwargs):
+        ids = [name_to_id(name) for name in names]
+        docs = self._client.mget(index=self._index, body={'ids': ids}, **kwargs)['docs']
+        return {name: doc for name, doc in zip(names, docs) if doc.get('found')}
+
+    # keyword field to aggregate field: the field if it is keyword, its keyword subfield if text, or None
+    # keywords with ignore_above, like the subfield of dynamic mapping, are None
+    def _keyword_field(self, field):
+        checked = self._keyword_fields.get(field)
+        if checked is not None and time.time() - checked[1] < MAPPING_TTL:
+            return checked[0]
+        res = self._client.indices.get_field_mapping(fields=[field, field+'.keyword'], index=self._index)
+        candidates = []
+        for index_mapping in res.values():
+            mappings = index_mapping.get('mappings', {})
+            # values over ignore_above are not indexed and would be missing from the buckets
+            keywords = [name for name, m in mappings.items() if list(m['mapping'].values())[0].get('type') == 'keyword'
+                        and 'ignore_above' not in list(m['mapping'].values())[0]]
+            if field in keywords:
+                candidates.append(field)
+            elif field+'.keyword' in keywords:
+                candidates.append(field+'.keyword')
+            else:
+                candidates.append(None)
+        # all indexes of an alias need the same field
+        keyword_field = candidates[0] if len(set(candidates)) == 1 else None
+        self._keyword_fields[field] = (keyword_field, time.time())
+        return keyword_field
+
+    # contents of names and the terms of field with one search request instead of fetching the documents
+    # source_fields: fields of _source returned in the hits besides name
+    # return dict of hits (name: hit) and buckets (term: names of contents with the term)
+    # or None if field is not aggregatable, the buckets are over size, or names have duplicated documents
+    def aggregate(self, names, field, source_fields=(), size=AGG_MAX_TERMS):
+        names = list(dict.fromkeys(names))
+        if len(names) == 0:
+            return {'hits': {}, 'buckets': {}}
+        if len(names) > GET_LIST_MAX_HITS:
+            return None
+        agg_field = self._keyword_field(field)
+        if agg_field is None:
+            logging.warning(field+' is not aggregatable in '+self._index)
+            return None
+
+        if self._id_mode == 'name':
+            query = {"ids": {"values": [name_to_id(name) for name in names]}}
+        else:
+            query = {"terms": {"name.keyword": names}}
         search_query = {
-            "query": {
-                "match_all": {}
+            "size": len(names),
+            "version": True,
+            "seq_no_primary_term": True,
+            "_source": ["name"] + list(source_fields),
+            "query": query,
+            "aggs": {
+                "terms": {
+                    "terms": {"field": agg_field, "size": size},
+                    "aggs": {
+                        "contents": {"terms": {"field": "name.keyword", "size": len(names)}}
+                    }
+                }
             }
         }
-        res = self._client.search(index=self._index, body=search_query)
-        return res['hits']['hits'], 200
+        try:
+            res = self._client.search(index=self._index, body=search_query)
+        except ESConnectionError:
+            raise
+        except TransportError as err: # like too_many_buckets_exception
+            logging.warning('aggregation of '+field+' failed: '+str(err))
+            return None
+
+        hits = {}
+        for hit in res['hits']['hits']:
+            name = hit['_source'].get('name')
+            if name in hits:
+                logging.error('There are multiple contents with same name: ' + name + '. Please fix the data')
+                return None
+            hits[name] = self._from_stored(hit)
+        agg = res['aggregations']['terms']
+        if agg.get('sum_other_doc_count', 0) > 0:
+            logging.warning('aggregation of '+field+' has more than '+str(size)+' terms')
+            return None
+        buckets = {bucket['key']: [c['key'] for c in bucket['contents']['buckets']] for bucket in agg['buckets']}
+        return {'hits': hits, 'buckets': buckets}
+
+    # current version of names like content_cache.doc_version, with one request per chunk
+    # names with no document or with multiple documents are not in the result
+    # cached documents of other versions are dropped, so the next get_list reads the current ones
+    def versions(self, names, chunk_size=GET_LIST_CHUNK_SIZE):
+        names = list(dict.fromkeys(names))
+        versions = self._versions(names, chunk_size)
+        if self._cache is not None:
+            self._cache.confirm(versions, names)
+        return versions
+
+    # current (primary term, seq no) of names without _source
+    # names with no document or with multiple documents are not in the result
+    def _versions(self, names, chunk_size=GET_LIST_CHUNK_SIZE):
+        versions = {}
+        for i in range(0, len(names), chunk_size):
+            chunk = names[i:i+chunk_size]
+            if self._id_mode == 'name':
+                for name, doc in self._mget_by_id(chunk, _source=False).items():
+                    versions[name] = doc_version(doc)
+                continue
+            search_query = {
+                "size": GET_LIST_MAX_HITS,
+                "_source": ["name"],
+                "seq_no_primary_term": True,
+                "query": {
+                    "terms": {
+                        "name.keyword": chunk
+                    }
+                }
+            }
+            counts = {}
+            for hit in self._client.search(index=self._index, body=search_query)['hits']['hits']:
+                name = hit['_source'].get('name')
+                counts[name] = counts.get(name, 0) + 1
+                versions[name] = doc_version(hit)
+            for name, count in counts.items():
+                if count > 1:
+                    del versions[name]
+        return versions
+
+    # _source to write: the body with the view and the document id in the layout of the index
+    # the body of the caller is not changed
+    def _stored(self, body, id):
+        fields = self._view(body) if self._view is not None else {}
+        if self._layout == 'flat':
+            stored = flatten_source({k: v for k, v in body.items() if k not in fields})
+            stored.update(fields)
+        else:
+            stored = dict(body, **fields)
+        stored[ID_FIELD] = id
+        return stored
+
+    # keep the document written by this instance in the cache
+    # res: response of index. body: written _source
+    def _cache_written(self, name, res, body):
+        if self._cache is None:
+            return
+        doc = {'_index': self._index, '_type': self._doc_type, '_id': res['_id'], '_version': res.get('_version'),
+               '_seq_no': res.get('_seq_no'), '_primary_term': res.get('_primary_term'), '_source': copy.deepcopy(body)}
+        self._cache.update(name, self._from_stored(doc))
 
     def post(self, name, body={}):
-        res, code = self.name_check(name)
+        msg, code = self.name_check(name)
         if code==400:
             return msg, code
+        if type(body)!=dict:
+            msg = 'Body must be dictionary'
+            logging.error(msg)
+            return msg, 400
+        if self._id_mode == 'name':
+            return self._create_by_id(name, body)
+
         res, code = self.get(name)
         if code==200:
             msg = name+' is exist'
             logging.warn(msg)
             return msg, 400
-        if type(body)!=dict:
-            msg = 'Body must be dictionary'
-            logging.error(msg)
-            return msg, 400
 
         res_dict = body
         res_dict['name'] = name
-        res = self._client.index(index=self._index, body=res_dict, doc_type=self._doc_type)
+        doc_id = new_id()
+        res_dict = self._stored(res_dict, doc_id)
+        res = self._client.index(id=doc_id, index=self._index, body=res_dict, doc_type=self._doc_type)
+        logging.info(name+' was created')
+        self._cache_written(name, res, res_dict)
+        self._notify(name)
+        return res, 201
+
+    # create only if the document id of name is not used. concurrent posts can not make duplicates
+    def _create_by_id(self, name, body):
+        res_dict = body
+        res_dict['name'] = name
+        res_dict = self._stored(res_dict, name_to_id(name))
+        try:
+            res = self._client.index(id=name_to_id(name), index=self._index, body=res_dict, doc_type=self._doc_type, op_type='create')
+        except ConflictError:
+            msg = name+' is exist'
+            logging.warning(msg)
+            return msg, 400
         logging.info(name+' was created')
+        self._cache_written(name, res, res_dict)
+        self._notify(name)
         return res, 201
 
     def put(self, name, body={}):
@@ -176,8 +670,9 @@ class ElasticUtilNameId(ElasticUtil):
             msg = 'Body must be dictionary'
             logging.error(msg)
             return msg, 400
+        if self._id_mode == 'name':
+            return self._put_by_id(name, body)
 
-        res = self.get(name)
         res_dict = body
         res_dict['name'] = name
 
@@ -186,13 +681,20 @@ class ElasticUtilNameId(ElasticUtil):
             print(body, res, code)
             if code==200:
                 doc_id = res['_id']
+                res_dict = self._stored(res_dict, doc_id)
                 # res = self._client.delete(id=doc_id, index=self._index, doc_type=self._doc_type, reflesh=True)
                 res = self._client.index(id=doc_id, index=self._index, body=res_dict, doc_type=self._doc_type)
                 logging.info(name+' was updated')
+                self._cache_written(name, res, res_dict)
+                self._notify(name)
                 return res, 200
             elif code==404:
-                res = self._client.index(index=self._index, body=res_dict, doc_type=self._doc_type)
+                doc_id = new_id()
+                res_dict = self._stored(res_dict, doc_id)
+                res = self._client.index(id=doc_id, index=self._index, body=res_dict, doc_type=self._doc_type)
                 logging.info(name+' was created')            
+                self._cache_written(name, res, res_dict)
+                self._notify(name)
                 return res, 201
             elif code==500:
                 return res, code
@@ -200,17 +702,98 @@ class ElasticUtilNameId(ElasticUtil):
             logging.error(err)
             return 'Elasticsearch RequestError', 500
 
+    # create or overwrite the document id of name without searching
+    def _put_by_id(self, name, body):
+        res_dict = body
+        res_dict['name'] = name
+        res_dict = self._stored(res_dict, name_to_id(name))
+        try:
+            res = self._client.index(id=name_to_id(name), index=self._index, body=res_dict, doc_type=self._doc_type)
+        except RequestError as err:
+            logging.error(err)
+            return 'Elasticsearch RequestError', 500
+        self._cache_written(name, res, res_dict)
+        if res['result'] == 'created':
+            logging.info(name+' was created')
+            self._notify(name)
+            return res, 201
+        logging.info(name+' was updated')
+        self._notify(name)
+        return res, 200
+
+    # create or update multiple contents with chunked bulk requests
+    # bodies: dict of name: body
+    # overwrite: update existing contents. existing contents are skipped with 400 if False
+    # existing: found dict of get_list if already checked by the caller
+    # return dict of name: (result or message, code)
+    def bulk_post(self, bodies, overwrite=False, existing=None, chunk_size=BULK_CHUNK_SIZE):
+        report = {}
+        if existing is None:
+            res, code = self.get_list(bodies.keys())
+            existing = res['found']
+            for name in res['duplicates']:
+                report[name] = ('There are multiple contents with same name: ' + name + '. Please fix the data', 500)
+
+        names = []
+        actions = []
+        for name, body in bodies.items():
+            if name in report:
+                continue
+            msg, code = self.name_check(name)
+            if code==400:
+                report[name] = (msg, code)
+                continue
+            if type(body)!=dict:
+                report[name] = ('Body must be dictionary', 400)
+                continue
+            if name in existing and not overwrite:
+                report[name] = (name+' is exist', 400)
+                continue
+
+            res_dict = body
+            res_dict['name'] = name
+            action = {'_index': self._index}
+            if self._id_mode == 'name':
+                action['_id'] = name_to_id(name)
+                if not overwrite:
+                    action['_op_type'] = 'create'
+            elif name in existing:
+                action['_id'] = existing[name]['_id']
+            else:
+                action['_id'] = new_id()
+            action['_source'] = self._stored(res_dict, action['_id'])
+            names.append(name)
+            actions.append(action)
+
+        results = helpers.streaming_bulk(self._client, actions, chunk_size=chunk_size,
+                                         raise_on_error=False, raise_on_exception=False)
+        for name, action, (ok, item) in zip(names, actions, results):
+            op_type, res = list(item.items())[0]
+            if ok:
+                code = 201 if res.get('result') == 'created' else 200
+                report[name] = (res, code)
+                self._cache_written(name, res, action['_source'])
+                self._notify(name)
+            elif res.get('status') == 409:
+                report[name] = (name+' is exist', 400)
+            else:
+                logging.error(res)
+                report[name] = (str(res.get('error', 'Elasticsearch bulk error')), 500)
+        logging.info(str(len(actions))+' contents were sent with bulk requests')
+        return report
+
 
 
+# create the indexes used by api.py. run once before starting the servers
+# usage: python elastic_util.py
+def bootstrap_indices():
+    from graph import VIEW_MAPPING
+    es_params = es_params_from_env()
+    ElasticUtil(index='users', **es_params)
+    ElasticUtilNameId(index=os.environ.get('ELASTIC_CONTENTS_INDEX', 'contents'),
+                      id_mode=os.environ.get('ELASTIC_CONTENTS_ID_MODE', 'search'),
+                      layout=os.environ.get('ELASTIC_CONTENTS_LAYOUT', 'raw'), mappings=VIEW_MAPPING, **es_params)
 
 if __name__ == "__main__":
     # Initial setup for elasticsearch
-    eu_user = ElasticUtil(index=INDEX_NAMES[1])
-    eu_contents = ElasticUtilNameId(index=INDEX_NAMES[0])
-    # print(eu.post('test'))
-    # print(eu.put('test'))
-    # print(eu.put('test2'))
-    # print(eu.get('2'))
-    # print(eu.get('test'))
-
-    # print(eu.get_all())
\ No newline at end of file
+    bootstrap_indices()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# in-memory stand-in of the Elasticsearch client for offline benchmarks
+# supports the calls used by elastic_util.py: get, exists, index, update, mget, search, scroll and bulk (index, create, update)
+# queries: match_all, ids, term, terms, exists and bool (must, must_not). field.keyword matches the field of _source
+# sort: _doc or one field of _source like the unique sort key of get_page
+# aggregations: terms with sub aggregations. _source filtering with a list of fields
+# mappings come from the index template, or are inferred like dynamic mapping
+
+import copy
+import json
+import itertools
+
+from elasticsearch.serializer import JSONSerializer
+from elasticsearch.exceptions import NotFoundError, ConflictError, RequestError
+
+# keys of the body of an update like the real parser. unknown keys are a parse error
+UPDATE_BODY_KEYS = ['doc', 'upsert', 'doc_as_upsert', 'script', 'scripted_upsert', 'detect_noop', '_source']
+
+# helpers.streaming_bulk serializes actions with client.transport.serializer
+class InMemoryTransport(object):
+    def __init__(self):
+        self.serializer = JSONSerializer()
+
+class InMemoryIndices(object):
+    def __init__(self, es):
+        self._es = es
+
+    def exists(self, index, **kwargs):
+        return index in self._es.indexes
+
+    # legacy template with settings and mappings at the top level
+    def put_template(self, name, body, **kwargs):
+        self._es.templates[name] = body
+        return {'acknowledged': True}
+
+    def create(self, index, body=None, **kwargs):
+        if index in self._es.indexes:
+            raise RequestError(400, 'resource_already_exists_exception', {})
+        self._es.indexes[index] = {}
+        self._es.settings[index] = body or {}
+        for template in self._es.templates.values():
+            if index in template['index_patterns']:
+                self._es.mappings[index] = copy.deepcopy(template.get('mappings', {}))
+        if (body or {}).get('mappings'):
+            self.put_mapping(body['mappings'], index)
+        return {'acknowledged': True, 'index': index}
+
+    # explicit mappings are merged into the template mappings. other fields keep dynamic mapping
+    # changing the type of a mapped field is an error like the real put mapping
+    def put_mapping(self, body, index=None, **kwargs):
+        conflicts = mapping_conflicts(self._mapping(index)['properties'], body.get('properties', {}))
+        if conflicts:
+            raise RequestError(400, 'illegal_argument_exception', {'conflicts': conflicts})
+        mapping = self._es.mappings.setdefault(index, {})
+        mapping.setdefault('properties', {}).update(copy.deepcopy(body.get('properties', {})))
+        return {'acknowledged': True}
+
+    # explicit mappings over the dynamic mapping of the documents
+    def _mapping(self, index):
+        mapping = dynamic_mapping(self._es.indexes.get(index, {}).values())
+        explicit = self._es.mappings.get(index, {})
+        if explicit.get('dynamic') is False:
+            mapping = {}
+        return {'properties': dict(mapping.get('properties', {}), **explicit.get('properties', {}))}
+
+    # mapping of each field like the real response. missing fields are not in the result
+    def get_field_mapping(self, fields, index, **kwargs):
+        mapping = self._mapping(index)
+        res = {}
+        for field in fields:
+            node = {'properties': mapping.get('properties', {})}
+            for part in field.split('.'):
+                children = dict(node.get('properties', {}), **node.get('fields', {}))
+                node = children.get(part)
+                if node is None:
+                    break
+            if node is not None:
+                res[field] = {'full_name': field, 'mapping': {field.split('.')[-1]: node}}
+        return {index: {'mappings': res}}
+
+# mapping made by dynamic mapping of the documents. strings are text with keyword subfield
+def dynamic_mapping(docs):
+    def field(value):
+        if isinstance(value, list):
+            return field(value[0]) if len(value) else None
+        if isinstance(value, dict):
+            return {'properties': properties([value])}
+        if isinstance(value, bool):
+            return {'type': 'boolean'}
+        if isinstance(value, int):
+            return {'type': 'long'}
+        if isinstance(value, float):
+            return {'type': 'float'}
+        return {'type': 'text', 'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}}}
+    def properties(sources):
+        res = {}
+        for source in sources:
+            for k, v in source.items():
+                mapping = field(v)
+                if mapping is None:
+                    continue
+                if 'properties' in mapping and 'properties' in res.get(k, {}):
+                    res[k]['properties'].update(mapping['properties'])
+                else:
+                    res.setdefault(k, mapping)
+        return res
+    return {'properties': properties(doc['_source'] for doc in docs)}
+
+# dotted names of fields in new mapped with another type in old
+def mapping_conflicts(old, new, prefix=''):
+    kind = lambda m: m.get('type', 'object' if 'properties' in m else None)
+    conflicts = []
+    for name, mapping in new.items():
+        if name not in old:
+            continue
+        if kind(old[name]) != kind(mapping):
+            conflicts.append(prefix+name)
+        elif kind(mapping) == 'object':
+            conflicts.extend(mapping_conflicts(old[name].get('properties', {}), mapping.get('properties', {}), prefix+name+'.'))
+    return conflicts
+
+# values of the dotted field in the source. .keyword is the field itself
+def field_values(source, field):
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+    values = [source]
+    for part in field.split('.'):
+        found = []
+        for value in values:
+            for v in (value if isinstance(value, list) else [value]):
+                if isinstance(v, dict) and part in v:
+                    found.append(v[part])
+        values = found
+    res = []
+    for value in values:
+        res.extend(value if isinstance(value, list) else [value])
+    return res
+
+# source with only the dotted fields
+def filter_source(source, fields):
+    res = {}
+    for field in fields:
+        value, parts = source, field.split('.')
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = res
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = copy.deepcopy(value)
+    return res
+
+class InMemoryElasticsearch(object):
+    def __init__(self):
+        self.indexes = {} # index: {id: {'_source', '_version', '_seq_no'}}
+        self.settings = {}
+        self.templates = {}
+        self.mappings = {} # index: mappings of the template used to create the index
+        self.requests = 0 # number of calls like round trips of the real client
+        self.indices = InMemoryIndices(self)
+        self.transport = InMemoryTransport()
+        self._seq_no = itertools.count()
+        self._auto_id = itertools.count(1)
+        self._scrolls = {}
+        self._scroll_id = itertools.count(1)
+
+    def _docs(self, index):
+        return self.indexes.setdefault(index, {})
+
+    def _hit(self, index, id, doc, version=False, seq_no=False):
+        hit = {'_index': index, '_type': '_doc', '_id': id, '_source': copy.deepcopy(doc['_source'])}
+        if version:
+            hit['_version'] = doc['_version']
+        if seq_no:
+            hit['_seq_no'] = doc['_seq_no']
+            hit['_primary_term'] = 1
+        return hit
+
+    def exists(self, index, id, **kwargs):
+        self.requests += 1
+        return id in self._docs(index)
+
+    def get(self, index, id, **kwargs):
+        self.requests += 1
+        doc = self._docs(index).get(id)
+        if doc is None:
+            raise NotFoundError(404, 'not_found', {'_index': index, '_id': id, 'found': False})
+        return dict(self._hit(index, id, doc, True, True), found=True)
+
+    def _write(self, index, id, body, op_type=None):
+        docs = self._docs(index)
+        if id is None:
+            id = 'auto%d' % next(self._auto_id)
+        old = docs.get(id)
+        if old is not None and op_type == 'create':
+            raise ConflictError(409, 'version_conflict_engine_exception', {'_id': id})
+        version = 1 if old is None else old['_version'] + 1
+        docs[id] = {'_source': copy.deepcopy(body), '_version': version, '_seq_no': next(self._seq_no)}
+        return {'_index': index, '_type': '_doc', '_id': id, '_version': version, '_seq_no': docs[id]['_seq_no'],
+                '_primary_term': 1, 'result': 'created' if old is None else 'updated'}
+
+    # partial update of the source with body['doc']. if_seq_no and if_primary_term are checked like the real client
+    def _update(self, index, id, body, if_seq_no=None, if_primary_term=None):
+        unknown = [key for key in body if key not in UPDATE_BODY_KEYS]
+        if unknown:
+            raise RequestError(400, 'x_content_parse_exception', {'_id': id, 'unknown': unknown})
+        if 'doc' not in body:
+            raise RequestError(400, 'stub supports only doc updates', {'_id': id})
+        docs = self._docs(index)
+        old = docs.get(id)
+        if old is None:
+            raise NotFoundError(404, 'document_missing_exception', {'_id': id})
+        if (if_seq_no is not None and old['_seq_no'] != if_seq_no) or (if_primary_term is not None and if_primary_term != 1):
+            raise ConflictError(409, 'version_conflict_engine_exception', {'_id': id})
+        return self._write(index, id, dict(old['_source'], **body['doc']))
+
+    def update(self, index, id, body, doc_type=None, if_seq_no=None, if_primary_term=None, **kwargs):
+        self.requests += 1
+        return self._update(index, id, body, if_seq_no, if_primary_term)
+
+    def index(self, index, body, id=None, doc_type=None, op_type=None, **kwargs):
+        self.requests += 1
+        return self._write(index, id, body, op_type)
+
+    def mget(self, body, index, **kwargs):
+        self.requests += 1
+        docs = self._docs(index)
+        res = []
+        for id in body['ids']:
+            if id in docs:
+                res.append(dict(self._hit(index, id, docs[id], True, True), found=True))
+            else:
+                res.append({'_index': index, '_type': '_doc', '_id': id, 'found': False})
+        return {'docs': res}
+
+    def _match(self, query, id, source):
+        if 'match_all' in query:
+            return True
+        if 'ids' in query:
+            return id in query['ids']['values']
+        if 'exists' in query:
+            return len(field_values(source, query['exists']['field'])) > 0
+        if 'bool' in query:
+            clauses = lambda kind: query['bool'].get(kind, []) if isinstance(query['bool'].get(kind, []), list) else [query['bool'][kind]]
+            return all(self._match(q, id, source) for q in clauses('must')) \
+                and not any(self._match(q, id, source) for q in clauses('must_not'))
+        for kind in ('term', 'terms'):
+            if kind in query:
+                field, value = next(iter(query[kind].items()))
+                value = source.get(field[:-len('.keyword')] if field.endswith('.keyword') else field)
+                return value == query[kind][field] if kind == 'term' else value in query[kind][field]
+        raise RequestError(400, 'parsing_exception', {'query': query})
+
+    def search(self, index, body=None, scroll=None, size=None, from_=0, **kwargs):
+        self.requests += 1
+        body = dict(body or {})
+        for key in ('query', 'sort', 'search_after', 'version', 'seq_no_primary_term'):
+            if key in kwargs:
+                body[key] = kwargs[key]
+        size = body.get('size', 10) if size is None else size
+        query = body.get('query', {'match_all': {}})
+        docs = self._docs(index)
+        hits = []
+        for id in sorted(docs):
+            doc = docs[id]
+            if self._match(query, id, doc['_source']):
+                hit = self._hit(index, id, doc, body.get('version', False), body.get('seq_no_primary_term', False))
+                if 'sort' in body:
+                    sort = body['sort'][0] if isinstance(body['sort'], list) else body['sort']
+                    field = sort if isinstance(sort, str) else next(iter(sort))
+                    values = [id] if field in ('_doc', '_id') else field_values(doc['_source'], field)
+                    if len(values) == 0: # missing values are sorted last by elasticsearch, which breaks search_after
+                        raise RequestError(400, 'document without the sort field', {'sort': field, '_id': id})
+                    hit['sort'] = [values[0]]
+                if isinstance(body.get('_source'), list):
+                    hit['_source'] = filter_source(hit['_source'], body['_source'])
+                hits.append(hit)
+        if 'sort' in body:
+            hits.sort(key=lambda hit: hit['sort'][0])
+        if 'search_after' in body:
+            hits = [hit for hit in hits if hit['sort'][0] > body['search_after'][0]]
+        total = {'value': len(hits), 'relation': 'eq'}
+        shards = {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}
+        if scroll is not None:
+            scroll_id = str(next(self._scroll_id))
+            self._scrolls[scroll_id] = (hits[from_+size:], size)
+            return {'_scroll_id': scroll_id, '_shards': shards, 'hits': {'total': total, 'hits': hits[from_:from_+size]}}
+        res = {'_shards': shards, 'hits': {'total': total, 'hits': hits[from_:from_+size]}}
+        if 'aggs' in body:
+            matched = [docs[hit['_id']] for hit in hits]
+            res['aggregations'] = self._aggregations(body['aggs'], matched)
+        return res
+
+    # buckets are ordered by doc_count and key like the real terms aggregation
+    def _aggregations(self, aggs, docs):
+        res = {}
+        for name, spec in aggs.items():
+            if 'terms' not in spec:
+                raise RequestError(400, 'parsing_exception', {'aggs': spec})
+            members = {}
+            for doc in docs:
+                for value in dict.fromkeys(field_values(doc['_source'], spec['terms']['field'])):
+                    members.setdefault(value, []).append(doc)
+            keys = sorted(members, key=lambda key: (-len(members[key]), key))
+            size = spec['terms'].get('size', 10)
+            buckets = []
+            for key in keys[:size]:
+                bucket = {'key': key, 'doc_count': len(members[key])}
+                bucket.update(self._aggregations(spec.get('aggs', {}), members[key]))
+                buckets.append(bucket)
+            res[name] = {'doc_count_error_upper_bound': 0,
+                         'sum_other_doc_count': sum(len(members[key]) for key in keys[size:]), 'buckets': buckets}
+        return res
+
+    def scroll(self, scroll_id, **kwargs):
+        self.requests += 1
+        hits, size = self._scrolls.get(scroll_id, ([], 0))
+        self._scrolls[scroll_id] = (hits[size:], size)
+        return {'_scroll_id': scroll_id, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+                'hits': {'hits': hits[:size]}}
+
+    def clear_scroll(self, scroll_id=None, **kwargs):
+        self._scrolls.pop(scroll_id, None)
+        return {'succeeded': True}
+
+    # body: ndjson of action and source lines as made by helpers.streaming_bulk
+    def bulk(self, body, index=None, **kwargs):
+        self.requests += 1
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            op_type, action = next(iter(lines[i].items()))
+            source = lines[i+1] if op_type in ('index', 'create', 'update') else None
+            i += 2 if source is not None else 1
+            target = action.get('_index', index)
+            try:
+                if op_type == 'update':
+                    res = self._update(target, action.get('_id'), source, action.get('if_seq_no'), action.get('if_primary_term'))
+                else:
+                    res = self._write(target, action.get('_id'), source, op_type)
+                item = dict(res, status=201 if res['result'] == 'created' else 200)
+            except (ConflictError, NotFoundError, RequestError) as e:
+                errors = True
+                item = {'_index': target, '_id': action.get('_id'), 'status': e.status_code,
+                        'error': {'type': e.error, 'reason': str(e.info)}}
+            items.append({op_type: item})
+        return {'took': 0, 'errors': errors, 'items': items}
@@ -1,18 +1,52 @@
+import os
 import re
+import json
+import heapq
+import hashlib
 import networkx as nx
 import logging
 from copy import deepcopy 
 
-key_rm = ['name', '放送期間', '放送時間', '公開', '上映時間', '次作', '回数', '放送分']
+# graph view stored with the content document. see graph_view
+VIEW_KEY = 'graph_view'
+VIEW_VERSION = 2
+# edges of the view are 'attr EDGE_SEP relation' keywords, aggregated by elasticsearch in graph_views_from_buckets
+EDGE_SEP = '\u001f'
+VIEW_EDGES_FIELD = VIEW_KEY + '.edges'
+# fields of the view needed with the aggregation
+VIEW_SOURCE_FIELDS = [VIEW_KEY + '.' + k for k in ['version', 'genre', 'merged_genre', 'rules']]
+# explicit mapping of the view in both layouts. only the edges are indexed, as keyword without ignore_above
+VIEW_MAPPING = {VIEW_KEY: {'type': 'object', 'dynamic': False, 'properties': {'edges': {'type': 'keyword'}}}}
+
+key_rm = ['name', '放送期間', '放送時間', '公開', '上映時間', '次作', '回数', '放送分', VIEW_KEY]
 value_rm = ['', '同上', '日本', '日本語', '英語', '公式サイト', 'ほか', 'ステレオ放送', '文字多重放送','歴代エンディングテーマを参照',
             'フジテレビ番組基本情報']
 count_once = True
+# rules of merge_genre_name. [pattern, genre] applied in order to the result of the previous rule
+GENRE_RULES = [
+    ['(.*バラエティ.*)|(.*お笑い.*)', 'バラエティ'],
+    ['.*ドラマ.*', 'ドラマ'],
+    ['.*SF.*', 'SF'],
+]
+
+# compiled genre rules with the id of the rules
+# path: json file of [pattern, genre] list. GENRE_RULES if empty
+def load_genre_rules(path=''):
+    rules = GENRE_RULES
+    if path:
+        with open(path, encoding='utf-8') as f:
+            rules = json.load(f)
+    id = hashlib.sha1(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+    return {'id': id, 'rules': [(re.compile(pattern), genre) for pattern, genre in rules]}
+
+# rules configured by GENRE_RULES_FILE environment variable
+genre_rules = load_genre_rules(os.environ.get('GENRE_RULES_FILE', ''))
 
 def pre_create_graph(points, data):
     res = {}
     for name, point in points.items():
         if name not in data:
-            logging('name mismatch in points and data')
+            logging.warning('name mismatch in points and data')
             continue
         res[name] = {
             'point': point,
@@ -20,33 +54,56 @@ def pre_create_graph(points, data):
         }
     return res
 
+#contents are read through content_view so the stored graph view is used if it is current
+#the genres are merged on the content nodes, same as merge_genre
 def create_graph(input, merge=True):
     G = nx.Graph()
     for name in input:
         point = input[name]['point']
-        G.add_node(name, genre='content', point=point)
-        attrs = set()
-        for k, v in input[name]['data'].items():
-            #add first genre to node attribute
-            if k == 'ジャンル':
-                if len(v)==0:
-                    G.nodes[name]['genre'] = v
-                else:
-                    G.nodes[name]['genre'] = v[0]
-            elif k not in key_rm:
-                for attr in v:
-                    if attr not in input.keys() and attr not in value_rm: #do nothing for contents itself
-                        if G.nodes.get(attr) is None: #first time
-                            G.add_node(attr, genre='attribute', point=point)
-                        elif not (attr in attrs and count_once): # from second time
-                            G.nodes[attr]['point'] += point
-                        G.add_edge(name, attr, relation=k) 
-                        attrs.add(attr)
-    if merge:
-        G = merge_genre(G)
+        genre, attrs = content_view(input[name]['data'], merge)
+        G.add_node(name, genre=genre, point=point)
+        for attr, relation, count in attrs:
+            if attr in input: #do nothing for contents itself
+                continue
+            weight = point if count_once else point * count
+            if G.nodes.get(attr) is None: #first time
+                G.add_node(attr, genre='attribute', point=weight)
+            else:
+                G.nodes[attr]['point'] += weight
+            G.add_edge(name, attr, relation=relation)
 
     return G
 
+#keep contents and the attributes with high point and degree within the budget
+#nodes: dict of name: {'genre', 'point'}, edges: list of (name, name)
+#degrees are counted once on the input and the nodes are not copied
+#return pruned nodes and edges
+def prune_graph(nodes, edges, max_nodes=None, min_point=None, min_degree=None):
+    if max_nodes is None and min_point is None and min_degree is None:
+        return nodes, edges
+    degree = {}
+    for u, v in edges:
+        degree[u] = degree.get(u, 0) + 1
+        degree[v] = degree.get(v, 0) + 1
+
+    contents = []
+    attrs = []
+    for name, attrs_of_node in nodes.items():
+        if attrs_of_node['genre'] != 'attribute':
+            contents.append(name)
+        elif (min_point is None or attrs_of_node['point'] >= min_point) and \
+                (min_degree is None or degree.get(name, 0) >= min_degree):
+            attrs.append(name)
+    if max_nodes is not None and len(contents) + len(attrs) > max_nodes:
+        attrs = heapq.nlargest(max(max_nodes - len(contents), 0), attrs,
+                               key=lambda name: (nodes[name]['point'], degree.get(name, 0)))
+
+    keep = set(contents)
+    keep.update(attrs)
+    nodes = {name: attrs_of_node for name, attrs_of_node in nodes.items() if name in keep}
+    edges = [(u, v) for u, v in edges if u in keep and v in keep]
+    return nodes, edges
+
 #pre process to visualize. 
 #todo: implement in frontend
 def reduce_node(input_G, max_number_of_nodes):
@@ -65,15 +122,103 @@ def reduce_node(input_G, max_number_of_nodes):
         first = False
     return G
 
+#first genre and attributes of a content
+#return genre and dict of attr: [number of appearance, relation of the last appearance]
+#attributes which are names of other contents are included
+def content_attributes(data):
+    genre = 'content'
+    attrs = {}
+    for k, v in data.items():
+        if k == 'ジャンル':
+            if len(v)==0:
+                genre = v
+            else:
+                genre = v[0]
+        elif k not in key_rm:
+            for attr in v:
+                if attr not in value_rm:
+                    if attr in attrs:
+                        attrs[attr][0] += 1
+                        attrs[attr][1] = k
+                    else:
+                        attrs[attr] = [1, k]
+    return genre, attrs
+
+#closed genre of a content genre
+#rules: output of load_genre_rules. genre_rules if None
+def merge_genre_name(genre, rules=None):
+    if not isinstance(genre, str): #empty genre list
+        return genre
+    for pattern, merged in (rules or genre_rules)['rules']:
+        if pattern.search(genre):
+            genre = merged
+    return genre
+
+#graph view of a content, computed when the content is written and stored under VIEW_KEY
+#genre, merged genre with the id of the rules, and attributes with relation and number of appearance
+#attributes which are names of other contents are included and removed by create_graph
+def graph_view(data, rules=None):
+    rules = rules or genre_rules
+    genre, attrs = content_attributes(data)
+    return {
+        'version': VIEW_VERSION,
+        'genre': genre,
+        'merged_genre': merge_genre_name(genre, rules),
+        'rules': rules['id'],
+        'attributes': list(attrs.keys()),
+        'relations': [relation for count, relation in attrs.values()],
+        'counts': [count for count, relation in attrs.values()],
+        'edges': [attr + EDGE_SEP + relation for attr, (count, relation) in attrs.items()],
+    }
+
+#field of the graph view. view of ElasticUtilNameId
+def graph_view_field(data):
+    return {VIEW_KEY: graph_view(data)}
+
+#genre and list of (attr, relation, number of appearance) of a content
+#the stored graph view is used unless it is missing or made by another version
+#the genre is merged again if the rules changed after the view was stored
+def content_view(data, merge=True, rules=None):
+    rules = rules or genre_rules
+    view = data.get(VIEW_KEY)
+    if not isinstance(view, dict) or view.get('version') != VIEW_VERSION:
+        view = graph_view(data, rules)
+    if not merge:
+        genre = view['genre']
+    elif view['rules'] == rules['id']:
+        genre = view['merged_genre']
+    else:
+        genre = merge_genre_name(view['genre'], rules)
+    return genre, zip(view['attributes'], view['relations'], view['counts'])
+
+#content data with graph views rebuilt from the aggregation of VIEW_EDGES_FIELD
+#hits: dict of name: hit with VIEW_SOURCE_FIELDS. buckets: dict of edge: names of contents with the edge
+#counts are 1, so it is same as create_graph only if count_once
+#return data of contents with a current view and names of the others which need the full document
+def graph_views_from_buckets(hits, buckets):
+    data = {}
+    stale = []
+    for name, hit in hits.items():
+        view = hit['_source'].get(VIEW_KEY)
+        if not isinstance(view, dict) or view.get('version') != VIEW_VERSION:
+            stale.append(name)
+            continue
+        view = dict(view, attributes=[], relations=[], counts=[])
+        data[name] = {'name': name, VIEW_KEY: view}
+    for edge, names in buckets.items():
+        attr, relation = edge.split(EDGE_SEP, 1)
+        for name in names:
+            if name in data:
+                view = data[name][VIEW_KEY]
+                view['attributes'].append(attr)
+                view['relations'].append(relation)
+                view['counts'].append(1)
+    return data, stale
+
 #mix the closed genres
 def merge_genre(input_G):
     G = deepcopy(input_G)
     for name in G.nodes:
         if G.nodes[name]['genre'] != 'attribute':
-            if re.search( '(.*バラエティ.*)|(.*お笑い.*)', G.nodes[name]['genre']):
-                G.nodes[name]['genre'] = 'バラエティ'
-            if re.search( '.*ドラマ.*', G.nodes[name]['genre']):
-                G.nodes[name]['genre'] = 'ドラマ'
-            if re.search( '.*SF.*', G.nodes[name]['genre']):
-                G.nodes[name]['genre'] = 'SF'
+            G.nodes[name]['genre'] = merge_genre_name(G.nodes[name]['genre'])
     return G
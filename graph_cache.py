@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# LRU cache of graph results
+# entries remember the user and contents they were built from and are removed when those are written
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+GRAPH_CACHE_MAX_BYTES = 64*1024*1024
+GRAPH_CACHE_TTL = 300 # seconds. bounds staleness for writes done by other processes
+
+# canonical key of /graph/get_from_id
+# user: document of the user returned by ElasticUtil.get
+def key_from_id(id, user):
+    return ('id', id, user.get('_version'), user.get('_seq_no'), user.get('_primary_term'))
+
+# canonical key of /graph/get_from_data
+# points: dict of name: point of checked contents
+# versions: dict of name: version of the content documents
+def key_from_data(points, versions):
+    source = json.dumps(sorted([name, float(point), versions.get(name)] for name, point in points.items()), ensure_ascii=False)
+    return ('data', hashlib.sha1(source.encode('utf-8')).hexdigest())
+
+class GraphCache(object):
+    # max_bytes: total json size of cached results
+    # ttl: seconds until an entry expires. no expiry if 0
+    def __init__(self, max_bytes=GRAPH_CACHE_MAX_BYTES, ttl=GRAPH_CACHE_TTL):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries = OrderedDict() # key: (value, size, contents, user, created time)
+        self._by_content = {}
+        self._by_user = {}
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # counter of invalidation. pass it to put to drop results built from data written meanwhile
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._ttl > 0 and time.time() - entry[4] > self._ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # value: json serializable result
+    # contents: names of contents used for the result
+    # user: id of the user used for the result
+    # generation: value of generation() before reading the inputs
+    def put(self, key, value, contents=(), user=None, generation=None):
+        size = len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self._max_bytes:
+            return
+        contents = list(contents)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, contents, user, time.time())
+            self._bytes += size
+            for name in contents:
+                self._by_content.setdefault(name, set()).add(key)
+            if user is not None:
+                self._by_user.setdefault(user, set()).add(key)
+            while self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        value, size, contents, user, created = self._entries.pop(key)
+        self._bytes -= size
+        for name in contents:
+            keys = self._by_content.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._by_content[name]
+        if user is not None:
+            keys = self._by_user.get(user)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._by_user[user]
+
+    # remove results which used the content. listener of ElasticUtilNameId
+    def invalidate_content(self, name):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._by_content.get(name, [])):
+                self._remove(key)
+                self.invalidations += 1
+
+    # remove results of the user. listener of ElasticUtil for users
+    def invalidate_user(self, id):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._by_user.get(id, [])):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_content.clear()
+            self._by_user.clear()
+            self._bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+# cache configured by GRAPH_CACHE_MAX_BYTES and GRAPH_CACHE_TTL environment variables
+def graph_cache_from_env():
+    return GraphCache(max_bytes=int(os.environ.get('GRAPH_CACHE_MAX_BYTES', GRAPH_CACHE_MAX_BYTES)),
+                      ttl=float(os.environ.get('GRAPH_CACHE_TTL', GRAPH_CACHE_TTL)))
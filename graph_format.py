@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# wire formats of graph responses
+# compact: node table of names, genre ids and points, edges as flat index pairs and a relation table
+# msgpack and brotli are locked in the Pipfile. environments without them, like a local checkout, use json and gzip
+# usage to compare size and encode time on a generated profile:
+#   python graph_format.py --contents 5000
+
+import gzip
+import json
+import time
+import argparse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ['default', 'compact']
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIN_COMPRESS_BYTES = 1024 # smaller bodies are sent as is
+
+# nodes: dict of name: {'genre', 'point'}
+# edges: list of (name, name)
+# relations: list of relation of each edge or None
+def to_compact(nodes, edges, relations=None):
+    names = list(nodes)
+    ids = {name: i for i, name in enumerate(names)}
+    genres = []
+    genre_ids = {}
+    node_genres = []
+    points = []
+    for name in names:
+        genre = nodes[name]['genre']
+        key = genre if isinstance(genre, str) else json.dumps(genre)
+        if key not in genre_ids:
+            genre_ids[key] = len(genres)
+            genres.append(genre)
+        node_genres.append(genre_ids[key])
+        points.append(nodes[name]['point'])
+
+    pairs = []
+    for u, v in edges:
+        pairs.append(ids[u])
+        pairs.append(ids[v])
+    res = {
+        'format': 'compact',
+        'names': names,
+        'genres': genres,
+        'node_genres': node_genres,
+        'points': points,
+        'edges': pairs, # [u0, v0, u1, v1, ...] indices of names
+    }
+    if relations is not None:
+        relation_table = []
+        relation_ids = {}
+        edge_relations = []
+        for relation in relations:
+            if relation not in relation_ids:
+                relation_ids[relation] = len(relation_table)
+                relation_table.append(relation)
+            edge_relations.append(relation_ids[relation])
+        res['relations'] = relation_table
+        res['edge_relations'] = edge_relations
+    return res
+
+# inverse of to_compact. return nodes, edges and relations
+def from_compact(compact):
+    names = compact['names']
+    genres = compact['genres']
+    nodes = {name: {'genre': genres[g], 'point': p}
+             for name, g, p in zip(names, compact['node_genres'], compact['points'])}
+    pairs = compact['edges']
+    edges = [(names[pairs[i]], names[pairs[i+1]]) for i in range(0, len(pairs), 2)]
+    relations = None
+    if 'relations' in compact:
+        relations = [compact['relations'][r] for r in compact['edge_relations']]
+    return nodes, edges, relations
+
+# mimetype of the response from Accept header
+# json if no supported type is listed, like text/html of browsers. None only if json is excluded with q=0
+def negotiate_mimetype(accept_mimetypes):
+    mimetypes = [JSON_MIMETYPE]
+    if msgpack is not None:
+        mimetypes.append(MSGPACK_MIMETYPE)
+    if not accept_mimetypes:
+        return JSON_MIMETYPE
+    mimetype = accept_mimetypes.best_match(mimetypes)
+    if mimetype is not None:
+        return mimetype
+    if any(quality == 0 and value in (JSON_MIMETYPE, 'application/*', '*/*') for value, quality in accept_mimetypes):
+        return None
+    return JSON_MIMETYPE
+
+# content encoding from Accept-Encoding header. br is preferred if brotli is installed
+def negotiate_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def encode(body, mimetype=JSON_MIMETYPE):
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(body, use_bin_type=True)
+    return json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return data
+
+if __name__ == "__main__":
+    from synthetic import synthetic_input
+    from graph import create_graph
+
+    parser = argparse.ArgumentParser(description='compare size and encode time of graph formats')
+    parser.add_argument('--contents', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    G = create_graph(synthetic_input(args.contents))
+    nodes = dict(G.nodes)
+    edges = list(G.edges)
+    relations = [G.edges[e]['relation'] for e in edges]
+    print('contents', args.contents, 'nodes', len(nodes), 'edges', len(edges))
+
+    bodies = {
+        'default': lambda: {'nodes': nodes, 'edges': edges},
+        'default(str edges)': lambda: {'nodes': nodes, 'edges': str(edges)},
+        'compact': lambda: to_compact(nodes, edges, relations),
+    }
+    mimetypes = [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+    encodings = [None, 'gzip'] + (['br'] if brotli is not None else [])
+    print('{:20s} {:22s} {:8s} {:>10s} {:>10s}'.format('format', 'mimetype', 'encoding', 'bytes', 'ms'))
+    for name, body in bodies.items():
+        for mimetype in mimetypes:
+            for encoding in encodings:
+                start = time.perf_counter()
+                for i in range(args.repeat):
+                    data = compress(encode(body(), mimetype), encoding)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                print('{:20s} {:22s} {:8s} {:10d} {:10.1f}'.format(name, mimetype, str(encoding), len(data), elapsed*1000))
@@ -0,0 +1,12 @@
+# gunicorn settings of the production server
+# graph cache, user graphs, jobs and single flight are kept in the memory of each process.
+# one process with threads keeps them shared. more workers need a shared job store
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120)) # scraping in sync mode takes seconds
+# import the app once before fork. elasticsearch clients connect in each worker
+preload_app = True
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# graph of a user which is updated with deltas instead of create_graph from scratch
+# usage to compare with create_graph on random operations:
+#   python incremental_graph.py --runs 200
+#   python -m pytest -q test_incremental_graph.py
+
+import math
+import random
+import argparse
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+from graph import pre_create_graph, create_graph, content_view, count_once
+
+USER_GRAPHS_MAX = 1000 # number of users whose graph is kept
+
+class IncrementalGraph(object):
+    # merge: merge the closed genres like create_graph
+    def __init__(self, merge=True):
+        self._merge = merge
+        self._G = nx.Graph()
+        self._contents = {} # name: {'point', 'attrs', 'version'}
+        self._attr_users = {} # attr: set of contents which have the attr
+
+    @property
+    def G(self):
+        return self._G
+
+    def points(self):
+        return {name: c['point'] for name, c in self._contents.items()}
+
+    # version of each content given to set_content
+    def versions(self):
+        return {name: c['version'] for name, c in self._contents.items()}
+
+    def __contains__(self, name):
+        return name in self._contents
+
+    # point added to the attribute by the content
+    def _weight(self, content, attr):
+        if count_once:
+            return content['point']
+        return content['point'] * content['attrs'][attr][0]
+
+    def _add_to_attr(self, name, attr):
+        content = self._contents[name]
+        if attr in self._G:
+            self._G.nodes[attr]['point'] += self._weight(content, attr)
+        else:
+            self._G.add_node(attr, genre='attribute', point=self._weight(content, attr))
+        self._G.add_edge(name, attr, relation=content['attrs'][attr][1])
+
+    def _remove_from_attr(self, name, attr):
+        users = self._attr_users[attr]
+        if any(u in self._contents and u != name for u in users):
+            self._G.nodes[attr]['point'] -= self._weight(self._contents[name], attr)
+            self._G.remove_edge(name, attr)
+        else:
+            self._G.remove_node(attr)
+
+    # add or replace content. cost is O(attributes of the content)
+    # version: version of the data, like content_cache.doc_version, to find contents changed by other processes
+    def set_content(self, name, point, data, version=None):
+        if name in self._contents:
+            self.remove_content(name)
+
+        genre, view = content_view(data, self._merge)
+        attrs = {attr: [count, relation] for attr, relation, count in view}
+        # the name is a content now, not an attribute of other contents
+        if name in self._G:
+            self._G.remove_node(name)
+        self._G.add_node(name, genre=genre, point=point)
+        self._contents[name] = {'point': point, 'attrs': attrs, 'version': version}
+        for attr in attrs:
+            self._attr_users.setdefault(attr, set()).add(name)
+            if attr not in self._contents:
+                self._add_to_attr(name, attr)
+
+    def remove_content(self, name):
+        content = self._contents.get(name)
+        if content is None:
+            return
+        for attr in content['attrs']:
+            if attr not in self._contents:
+                self._remove_from_attr(name, attr)
+            users = self._attr_users[attr]
+            users.discard(name)
+            if len(users) == 0:
+                del self._attr_users[attr]
+        self._G.remove_node(name)
+        del self._contents[name]
+
+        # the name is an attribute again if other contents have it
+        for user in self._attr_users.get(name, []):
+            self._add_to_attr(user, name)
+
+    # change point of content. cost is O(attributes of the content)
+    def set_point(self, name, point):
+        content = self._contents[name]
+        old = {attr: self._weight(content, attr) for attr in content['attrs'] if attr not in self._contents}
+        content['point'] = point
+        self._G.nodes[name]['point'] = point
+        for attr, weight in old.items():
+            self._G.nodes[attr]['point'] += self._weight(content, attr) - weight
+
+# graphs of users updated with the difference of checked points
+class UserGraphs(object):
+    def __init__(self, max_users=USER_GRAPHS_MAX, merge=True):
+        self._max_users = max_users
+        self._merge = merge
+        self._graphs = OrderedDict() # id: (IncrementalGraph, lock)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._graphs)
+
+    def _get(self, id):
+        with self._lock:
+            if id not in self._graphs:
+                self._graphs[id] = (IncrementalGraph(merge=self._merge), threading.Lock())
+                while len(self._graphs) > self._max_users:
+                    self._graphs.popitem(last=False)
+            self._graphs.move_to_end(id)
+            return self._graphs[id]
+
+    # apply the difference of points to the graph of the user
+    # points: dict of name: point of checked contents
+    # load: function(points) -> (points, data, versions) of found contents, called only for added and changed contents
+    # output: function(G) to make the result while the graph is locked
+    # versions: function(names) -> current version of each name. kept contents with another version or without
+    #   a current one were written by other processes, like bulk.py or other workers, and are loaded again.
+    #   no check if None, then only invalidate_content of this process reloads contents
+    def update(self, id, points, load, output=lambda G: G.copy(), versions=None):
+        graph, lock = self._get(id)
+        with lock:
+            current = graph.points()
+            for name in current:
+                if name not in points:
+                    graph.remove_content(name)
+            changed = set()
+            kept = [name for name in current if name in points]
+            if versions is not None and len(kept):
+                latest = versions(kept)
+                stored = graph.versions()
+                changed = {name for name in kept if latest.get(name) is None or latest[name] != stored[name]}
+                for name in changed:
+                    graph.remove_content(name)
+            added = {name: point for name, point in points.items() if name not in current or name in changed}
+            if len(added):
+                added, data, added_versions = load(added)
+                for name, point in added.items():
+                    graph.set_content(name, point, data[name], added_versions.get(name))
+            for name, point in points.items():
+                if name in current and name not in changed and current[name] != point:
+                    graph.set_point(name, point)
+            return output(graph.G)
+
+    # remove the content from graphs of all users so that it is loaded again. listener of ElasticUtilNameId
+    def invalidate_content(self, name):
+        with self._lock:
+            graphs = list(self._graphs.values())
+        for graph, lock in graphs:
+            with lock:
+                graph.remove_content(name)
+
+# compare nodes and edges of two graphs. return list of differences
+def graph_diff(G1, G2, rel_tol=1e-9):
+    diff = []
+    for name in set(G1.nodes) | set(G2.nodes):
+        if name not in G1 or name not in G2:
+            diff.append('node '+name)
+            continue
+        n1, n2 = G1.nodes[name], G2.nodes[name]
+        if n1['genre'] != n2['genre'] or not math.isclose(n1['point'], n2['point'], rel_tol=rel_tol, abs_tol=1e-9):
+            diff.append('node attributes '+name)
+    edges1 = {frozenset(e): G1.edges[e]['relation'] for e in G1.edges}
+    edges2 = {frozenset(e): G2.edges[e]['relation'] for e in G2.edges}
+    if edges1 != edges2:
+        diff.append('edges')
+    return diff
+
+# random operations on IncrementalGraph compared with create_graph after each operation
+def check(runs=100, steps=30, seed=0):
+    rnd = random.Random(seed)
+    names = ['c%d' % i for i in range(12)]
+    values = ['v%d' % i for i in range(15)] + names[:4] + ['', '日本']
+    keys = ['脚本', '演出', '出演者', 'ジャンル', '放送期間']
+    genres = ['バラエティ番組', 'テレビドラマ', 'SFドラマ', 'アニメ']
+    failures = 0
+    for run in range(runs):
+        graph = IncrementalGraph()
+        points = {}
+        data = {}
+        for step in range(steps):
+            name = rnd.choice(names)
+            op = rnd.random()
+            if op < 0.5 or name not in points:
+                d = {}
+                for k in rnd.sample(keys, rnd.randint(0, len(keys))):
+                    d[k] = rnd.sample(genres, 1) if k == 'ジャンル' else [rnd.choice(values) for i in range(rnd.randint(0, 4))]
+                points[name], data[name] = rnd.choice([0.2, 0.25, 0.5, 1.0]), d
+                graph.set_content(name, points[name], d)
+            elif op < 0.75:
+                points[name] = rnd.choice([0.1, 0.33, 0.6, 2.0])
+                graph.set_point(name, points[name])
+            else:
+                del points[name]
+                graph.remove_content(name)
+
+            expected = create_graph(pre_create_graph(points=points, data=data))
+            diff = graph_diff(graph.G, expected)
+            if diff:
+                failures += 1
+                print('run', run, 'step', step, diff)
+                break
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compare IncrementalGraph with create_graph on random operations')
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    failures = check(args.runs, args.steps, args.seed)
+    print(str(args.runs - failures)+'/'+str(args.runs)+' runs matched create_graph')
+    exit(1 if failures else 0)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# background jobs of slow requests like wikipedia scraping
+# jobs wait in a bounded queue and run on a fixed number of worker threads
+# the job store keeps status and result. a store has create, get and update
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+
+JOB_WORKERS = 4
+JOB_QUEUE_SIZE = 100
+JOB_TTL = 3600 # seconds to keep finished jobs
+JOB_STORES = ['memory']
+
+class JobQueueFull(Exception):
+    pass
+
+# job store in the memory of the process
+class MemoryJobStore(object):
+    def __init__(self, ttl=JOB_TTL):
+        self._ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    # kind: name of the task. params: json serializable description of the task
+    def create(self, kind, params):
+        now = time.time()
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'params': params, 'status': 'queued',
+               'code': None, 'result': None, 'created': now, 'updated': now}
+        with self._lock:
+            self._expire(now)
+            self._jobs[job['id']] = job
+        return dict(job)
+
+    def get(self, id):
+        with self._lock:
+            job = self._jobs.get(id)
+            return None if job is None else dict(job)
+
+    def update(self, id, **fields):
+        with self._lock:
+            job = self._jobs.get(id)
+            if job is None:
+                return
+            job.update(fields)
+            job['updated'] = time.time()
+
+    def delete(self, id):
+        with self._lock:
+            self._jobs.pop(id, None)
+
+    def _expire(self, now):
+        if self._ttl <= 0:
+            return
+        expired = [id for id, job in self._jobs.items()
+                   if job['status'] in ('done', 'failed') and now - job['updated'] > self._ttl]
+        for id in expired:
+            del self._jobs[id]
+
+class JobRunner(object):
+    # store: job store
+    # workers: number of threads running the jobs
+    # queue_size: max number of waiting jobs. submit raises JobQueueFull over it
+    def __init__(self, store, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self._store = store
+        self._workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        return self._store
+
+    def _start(self):
+        with self._lock:
+            if len(self._threads):
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._work, name='job-worker-%d' % i, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # run func(*args) in background. func returns (result, status code)
+    # return the created job
+    def submit(self, kind, params, func, *args):
+        self._start()
+        job = self._store.create(kind, params)
+        try:
+            self._queue.put_nowait((job['id'], func, args))
+        except queue.Full:
+            self._store.delete(job['id'])
+            raise JobQueueFull('Too many jobs in the queue')
+        return job
+
+    def _work(self):
+        while True:
+            id, func, args = self._queue.get()
+            self._store.update(id, status='running')
+            try:
+                res, code = func(*args)
+                status = 'done' if code < 400 else 'failed'
+            except Exception as e:
+                logging.exception('job '+id+' failed')
+                res, code, status = str(e), 500, 'failed'
+            self._store.update(id, status=status, code=code, result=res)
+            self._queue.task_done()
+
+    def stats(self):
+        return {'workers': self._workers, 'queued': self._queue.qsize(), 'queue_size': self._queue.maxsize}
+
+# runner configured by JOB_WORKERS, JOB_QUEUE_SIZE, JOB_TTL and JOB_STORE environment variables
+def job_runner_from_env():
+    kind = os.environ.get('JOB_STORE', 'memory')
+    if kind not in JOB_STORES:
+        raise ValueError('JOB_STORE must be one of '+', '.join(JOB_STORES))
+    store = MemoryJobStore(ttl=float(os.environ.get('JOB_TTL', JOB_TTL)))
+    return JobRunner(store, workers=int(os.environ.get('JOB_WORKERS', JOB_WORKERS)),
+                     queue_size=int(os.environ.get('JOB_QUEUE_SIZE', JOB_QUEUE_SIZE)))
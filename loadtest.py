@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# load test of the api at a fixed concurrency
+# the app runs in this process on a threaded http server with es_stub.InMemoryElasticsearch
+# seeded from synthetic.py, and wikipedia is a local server of synthetic pages
+# requests are replayed from a jsonl log or generated as a mix of endpoints
+# each line of the log: {"method": "GET", "path": "/contents/content1", "json": {...}}
+# json is the optional request body. name is the label in the report, the matched route by default
+# usage:
+#   python loadtest.py --concurrency 8 --requests 2000
+#   python loadtest.py --mix graph=1,contents=3,users=1,wiki=1 --record traffic.jsonl
+#   python loadtest.py --log traffic.jsonl --concurrency 16
+#   GRAPH_CACHE_MAX_BYTES=0 python loadtest.py --log traffic.jsonl
+#   python loadtest.py --log traffic.jsonl --url http://localhost:5000 (running server, no stand-ins)
+
+import io
+import os
+import sys
+import json
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+import urllib.parse
+from contextlib import redirect_stdout
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+CONCURRENCY = 8
+REQUESTS = 1000
+MIX = {'graph': 1, 'contents': 3, 'users': 1, 'wiki': 0} # weights of generated requests
+CONTENTS = 1000 # number of contents seeded in the stand-in
+USERS = 100
+USER_CONTENTS = 50 # number of checked contents of a generated graph request
+PERCENTILES = [50, 95, 99]
+
+# local wikipedia. any title returns a synthetic page seeded by the title
+class StubWikiHandler(BaseHTTPRequestHandler):
+    latency = 0.0 # seconds to sleep before the response
+
+    def do_GET(self):
+        from synthetic import synthetic_page
+        title = urllib.parse.unquote(self.path.split('/wiki/', 1)[-1])
+        time.sleep(self.latency)
+        body = synthetic_page(random.Random(title)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# start server in a daemon thread and return its base url
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:%d' % server.server_address[1]
+
+def start_stub_wiki(latency=0.0):
+    handler = type('Handler', (StubWikiHandler,), {'latency': latency})
+    return serve(ThreadingHTTPServer(('127.0.0.1', 0), handler))
+
+# start the app on stand-ins and return its base url and the app
+# the wikipedia stub must be configured before api is imported
+def start_app(contents=CONTENTS, users=USERS):
+    from werkzeug.serving import make_server
+    import api
+    from es_stub import InMemoryElasticsearch
+    from synthetic import synthetic_input, synthetic_user
+
+    es = InMemoryElasticsearch()
+    api.eu_content.set_client(es)
+    api.eu_user.set_client(es)
+    api.eu_content.bulk_post({name: dict(c['data'], name=name) for name, c in synthetic_input(contents).items()})
+    for i in range(users):
+        api.eu_user.put('user%d' % i, synthetic_user(min(contents, USER_CONTENTS), seed=i))
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = api.create_app()
+    return serve(make_server('127.0.0.1', 0, app, threaded=True)), app
+
+# parse weights like graph=1,contents=3
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, weight = item.split('=')
+        if kind not in MIX:
+            raise ValueError('kind of mix must be one of '+', '.join(MIX))
+        mix[kind] = float(weight)
+    return mix
+
+# list of requests of the weighted mix
+def generate_requests(n, mix=MIX, contents=CONTENTS, users=USERS, seed=0):
+    from synthetic import content_name, PAGE_NAMES
+    rnd = random.Random(seed)
+    kinds = [kind for kind, weight in mix.items() if weight > 0]
+    weights = [mix[kind] for kind in kinds]
+    res = []
+    for i in range(n):
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == 'graph':
+            names = rnd.sample([content_name(j) for j in range(contents)], min(contents, USER_CONTENTS))
+            data = {name: {'point': rnd.choice([0.2, 0.25, 0.5, 1.0]), 'checked': 1.0, 'id': -1.0} for name in names}
+            res.append({'method': 'POST', 'path': '/graph/get_from_data', 'json': {'data': data}})
+        elif kind == 'contents':
+            res.append({'method': 'GET', 'path': '/contents/'+content_name(rnd.randrange(contents))})
+        elif kind == 'users':
+            res.append({'method': 'GET', 'path': '/users/user%d' % rnd.randrange(users)})
+        else:
+            res.append({'method': 'POST', 'path': '/wiki/', 'json': {'name': rnd.choice(PAGE_NAMES)}})
+    return res
+
+def read_requests(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def write_requests(path, reqs):
+    with open(path, 'w', encoding='utf-8') as f:
+        for req in reqs:
+            f.write(json.dumps(req, ensure_ascii=False) + '\n')
+
+# label of the endpoint in the report like GET /contents/<string:name>
+# adapter: url adapter of the app to match the path. the path is used if it does not match
+def endpoint(req, adapter):
+    if 'name' in req:
+        return req['name']
+    try:
+        rule, args = adapter.match(req['path'].split('?')[0], req['method'], return_rule=True)
+        return req['method'] + ' ' + rule.rule
+    except Exception:
+        return req['method'] + ' ' + req['path']
+
+# send reqs from concurrency threads, each with its own keep-alive session
+# return list of (endpoint, seconds, status) and elapsed seconds. status is 0 for connection errors
+def run(base_url, reqs, adapter, concurrency=CONCURRENCY):
+    todo = queue.Queue()
+    for req in reqs:
+        todo.put(req)
+    results = []
+    lock = threading.Lock()
+
+    def work():
+        session = requests.Session()
+        done = []
+        while True:
+            try:
+                req = todo.get_nowait()
+            except queue.Empty:
+                break
+            start = time.perf_counter()
+            try:
+                r = session.request(req['method'], base_url + urllib.parse.quote(req['path'], safe='/?=&'), json=req.get('json'))
+                status = r.status_code
+            except requests.RequestException:
+                status = 0
+            done.append((endpoint(req, adapter), time.perf_counter() - start, status))
+        with lock:
+            results.extend(done)
+
+    threads = [threading.Thread(target=work) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+# nearest-rank percentile of sorted values
+def percentile(values, p):
+    return values[max(0, int(round(p / 100 * len(values))) - 1)]
+
+# throughput, error count and latency percentiles of each endpoint and of all requests
+def summarize(results, elapsed):
+    groups = {}
+    for name, seconds, status in results:
+        groups.setdefault(name, []).append((seconds, status))
+    groups['all'] = [(seconds, status) for name, seconds, status in results]
+    summary = {}
+    for name, items in groups.items():
+        latencies = sorted(seconds for seconds, status in items)
+        row = {'requests': len(items), 'rps': len(items) / elapsed,
+               'errors': sum(1 for seconds, status in items if status == 0 or status >= 400)}
+        for p in PERCENTILES:
+            row['p'+str(p)] = percentile(latencies, p)
+        summary[name] = row
+    return summary
+
+def print_summary(summary, elapsed, concurrency):
+    print('{} requests in {:.2f}s at concurrency {}'.format(summary['all']['requests'], elapsed, concurrency))
+    print('{:32s} {:>8s} {:>9s} {:>7s}'.format('endpoint', 'requests', 'rps', 'errors')
+          + ''.join('{:>10s}'.format('p'+str(p)) for p in PERCENTILES))
+    for name, row in sorted(summary.items(), key=lambda item: item[0] == 'all'):
+        print('{:32s} {:8d} {:9.1f} {:7d}'.format(name, row['requests'], row['rps'], row['errors'])
+              + ''.join('{:8.1f}ms'.format(row['p'+str(p)]*1000) for p in PERCENTILES))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='load test of the api')
+    parser.add_argument('--log', help='jsonl file of requests to replay. requests are generated if not given')
+    parser.add_argument('--record', help='jsonl file to write the generated requests')
+    parser.add_argument('--requests', type=int, default=REQUESTS, help='number of generated requests')
+    parser.add_argument('--mix', default=','.join(k+'='+str(v) for k, v in MIX.items()), help='weights of generated requests')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--contents', type=int, default=CONTENTS, help='number of contents in the stand-in')
+    parser.add_argument('--users', type=int, default=USERS, help='number of users in the stand-in')
+    parser.add_argument('--wiki-latency', type=float, default=0.0, help='seconds of each response of the wikipedia stub')
+    parser.add_argument('--url', help='base url of a running server. no stand-ins are started')
+    parser.add_argument('--output', help='json file to write the summary')
+    args = parser.parse_args()
+
+    if args.log:
+        reqs = read_requests(args.log)
+    else:
+        reqs = generate_requests(args.requests, parse_mix(args.mix), args.contents, args.users)
+    if args.record:
+        write_requests(args.record, reqs)
+
+    if args.url is None:
+        os.environ['WIKI_BASE_URL'] = start_stub_wiki(args.wiki_latency) + '/wiki/'
+        os.environ['WIKI_FETCH_MODE'] = 'page'
+        os.environ.setdefault('WIKI_RATE', '0')
+        base_url, app = start_app(args.contents, args.users)
+    else:
+        from api import create_app
+        base_url, app = args.url.rstrip('/'), create_app()
+
+    with redirect_stdout(io.StringIO()): # the api prints on each request
+        results, elapsed = run(base_url, reqs, app.url_map.bind('localhost'), args.concurrency)
+    summary = summarize(results, elapsed)
+    print_summary(summary, elapsed, args.concurrency)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'elapsed': elapsed, 'endpoints': summary}, f, indent=2)
+    sys.exit(0)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# in-process metrics in prometheus text format
+# observe is a bisect and a few additions under a lock so it can be left on under load
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join(k+'="'+str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')+'"' for k, v in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram(object):
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self._label_names = tuple(labels)
+        self._buckets = tuple(buckets)
+        self._series = {} # label values: [counts of each bucket and +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0]*(len(self._buckets)+1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = ['# HELP '+self.name+' '+self.help, '# TYPE '+self.name+' histogram']
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(self.name+'_bucket'+_labels_text(self._label_names, labels, [('le', _number(bound))])+' '+str(cumulative))
+            lines.append(self.name+'_sum'+_labels_text(self._label_names, labels)+' '+repr(total))
+            lines.append(self.name+'_count'+_labels_text(self._label_names, labels)+' '+str(cumulative))
+        return lines
+
+class Gauge(object):
+    # func: function returning the value, called on render. set is used if None
+    def __init__(self, name, help, labels=(), func=None):
+        self.name = name
+        self.help = help
+        self._label_names = tuple(labels)
+        self._func = func
+        self._values = {}
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def render(self):
+        lines = ['# HELP '+self.name+' '+self.help, '# TYPE '+self.name+' gauge']
+        values = {(): self._func()} if self._func is not None else dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(self.name+_labels_text(self._label_names, labels)+' '+_number(value))
+        return lines
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labels=(), func=None):
+        metric = Gauge(name, help, labels, func)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'Latency of requests by endpoint',
+                                     labels=('endpoint', 'method', 'status'))
+STAGE_SECONDS = REGISTRY.histogram('stage_duration_seconds', 'Time of each stage. elasticsearch is one round trip',
+                                   labels=('stage',))
+ES_REQUESTS = REGISTRY.histogram('elasticsearch_requests_per_request', 'Elasticsearch round trips in one http request',
+                                 labels=('endpoint',), buckets=COUNT_BUCKETS)
+GRAPH_NODES = REGISTRY.gauge('graph_nodes', 'Number of nodes of the last built graph', labels=('backend',))
+GRAPH_EDGES = REGISTRY.gauge('graph_edges', 'Number of edges of the last built graph', labels=('backend',))
+
+_local = threading.local()
+
+# time of the stage in STAGE_SECONDS and in the breakdown of the current http request
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        stages = getattr(_local, 'stages', None)
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+# size of the input of the current http request like number of checked contents
+def note(key, value):
+    sizes = getattr(_local, 'sizes', None)
+    if sizes is not None:
+        sizes[key] = value
+
+# count elasticsearch round trips of the current http request
+def count_es_request():
+    if getattr(_local, 'es_requests', None) is not None:
+        _local.es_requests += 1
+
+def start_request():
+    _local.es_requests = 0
+    _local.stages = {}
+    _local.sizes = {}
+    _local.start = time.perf_counter()
+
+# record the request and return its breakdown: seconds, stages, sizes and es_requests
+def end_request(endpoint, method, status):
+    start = getattr(_local, 'start', None)
+    if start is None:
+        return None
+    seconds = time.perf_counter() - start
+    REQUEST_SECONDS.observe(seconds, endpoint, method, status)
+    ES_REQUESTS.observe(_local.es_requests, endpoint)
+    breakdown = {'seconds': seconds, 'stages': _local.stages, 'sizes': _local.sizes, 'es_requests': _local.es_requests}
+    _local.es_requests = None
+    _local.stages = None
+    _local.sizes = None
+    _local.start = None
+    return breakdown
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# one-shot migration commands for the elasticsearch indexes
+# usage: python migrate.py name_id --source contents --dest contents_name_id
+#        python migrate.py graph_view --index contents
+#        python migrate.py flatten --source contents --dest contents_flat
+#        python migrate.py doc_id --index users
+
+import argparse
+import logging
+logging.basicConfig(level=logging.INFO)
+
+from elasticsearch import helpers
+from elasticsearch.exceptions import ConflictError, NotFoundError
+from elastic_util import ElasticUtil, ElasticUtilNameId, name_to_id, es_params_from_env, flatten_source, unflatten_source, without_id, \
+    ID_FIELD, BULK_CHUNK_SIZE
+from graph import graph_view, genre_rules, VIEW_KEY, VIEW_VERSION, VIEW_MAPPING
+
+def connect(index, id_mode='search', layout='raw'):
+    return ElasticUtilNameId(index=index, id_mode=id_mode, layout=layout, mappings=VIEW_MAPPING, **es_params_from_env())
+
+# reindex contents so that the document _id is made from the name
+# the first document wins if there are multiple documents with same name
+def migrate_name_id(source, dest):
+    eu_source = connect(source)
+    eu_dest = connect(dest, id_mode='name')
+
+    def actions():
+        for doc in helpers.scan(eu_source._client, index=source, query={'query': {'match_all': {}}}):
+            name = doc['_source'].get('name')
+            if not name:
+                logging.error('document without name: '+doc['_id'])
+                continue
+            yield {
+                '_op_type': 'create',
+                '_index': dest,
+                '_id': name_to_id(name),
+                '_source': dict(doc['_source'], **{ID_FIELD: name_to_id(name)}),
+            }
+
+    created = 0
+    skipped = []
+    for ok, item in helpers.streaming_bulk(eu_dest._client, actions(), chunk_size=BULK_CHUNK_SIZE,
+                                           raise_on_error=False, raise_on_exception=False):
+        if ok:
+            created += 1
+        else:
+            skipped.append(item)
+            logging.error(item)
+    logging.info(str(created)+' contents were migrated from '+source+' to '+dest+', '+str(len(skipped))+' were skipped')
+    logging.info('set ELASTIC_CONTENTS_INDEX='+dest+' and ELASTIC_CONTENTS_ID_MODE=name to use the new index')
+    return created, skipped
+
+# store the graph view in contents written before it existed, or made by other genre rules
+# force: recompute all views
+# layout: layout of the index
+# documents changed during the backfill are skipped by the sequence number check and keep the view of the write
+# one update request per document: the bulk helper of the pinned client does not send if_seq_no in the action
+def backfill_graph_view(index, force=False, layout='raw'):
+    eu = connect(index, layout=layout)
+
+    updated = 0
+    skipped = []
+    for doc in helpers.scan(eu._client, index=index, query={'query': {'match_all': {}}}, seq_no_primary_term=True):
+        view = doc['_source'].get(VIEW_KEY)
+        if not force and isinstance(view, dict) and view.get('version') == VIEW_VERSION \
+                and view.get('rules') == genre_rules['id']:
+            continue
+        body = {'doc': {VIEW_KEY: graph_view(without_id(unflatten_source(doc['_source']) if layout == 'flat' else doc['_source']))}}
+        try:
+            eu._client.update(index=index, id=doc['_id'], body=body,
+                              if_seq_no=doc['_seq_no'], if_primary_term=doc['_primary_term'])
+            updated += 1
+        except (ConflictError, NotFoundError) as err:
+            skipped.append(doc['_id'])
+            logging.warning(doc['_id']+' was changed during the backfill: '+str(err))
+    logging.info(str(updated)+' graph views were stored in '+index+', '+str(len(skipped))+' were skipped')
+    return updated, skipped
+
+# reindex contents of the raw layout into a new index of the flat layout
+# the index template is put before dest is created. document ids are kept, so both id modes work
+# the graph view is computed for documents without a current one
+def migrate_flatten(source, dest):
+    eu_source = connect(source)
+    eu_dest = connect(dest, layout='flat')
+
+    def actions():
+        for doc in helpers.scan(eu_source._client, index=source, query={'query': {'match_all': {}}}):
+            body = without_id(doc['_source'])
+            view = body.get(VIEW_KEY)
+            if not isinstance(view, dict) or view.get('version') != VIEW_VERSION:
+                body = dict(body, **{VIEW_KEY: graph_view(body)})
+            yield {
+                '_op_type': 'create',
+                '_index': dest,
+                '_id': doc['_id'],
+                '_source': dict(flatten_source(body, top_level=('name', VIEW_KEY)), **{ID_FIELD: doc['_id']}),
+            }
+
+    created = 0
+    skipped = []
+    for ok, item in helpers.streaming_bulk(eu_dest._client, actions(), chunk_size=BULK_CHUNK_SIZE,
+                                           raise_on_error=False, raise_on_exception=False):
+        if ok:
+            created += 1
+        else:
+            skipped.append(item)
+            logging.error(item)
+    logging.info(str(created)+' contents were migrated from '+source+' to '+dest+', '+str(len(skipped))+' were skipped')
+    logging.info('set ELASTIC_CONTENTS_INDEX='+dest+' and ELASTIC_CONTENTS_LAYOUT=flat to use the new index')
+    return created, skipped
+
+# store the document id in ID_FIELD of documents written before it existed
+# the index is bootstrapped first, which maps ID_FIELD as keyword
+def backfill_doc_id(index):
+    eu = ElasticUtil(index=index, **es_params_from_env())
+
+    def actions():
+        query = {'query': {'bool': {'must_not': {'exists': {'field': ID_FIELD}}}}}
+        for doc in helpers.scan(eu._client, index=index, query=query):
+            yield {
+                '_op_type': 'update',
+                '_index': index,
+                '_id': doc['_id'],
+                'doc': {ID_FIELD: doc['_id']},
+            }
+
+    updated = 0
+    skipped = []
+    for ok, item in helpers.streaming_bulk(eu._client, actions(), chunk_size=BULK_CHUNK_SIZE,
+                                           raise_on_error=False, raise_on_exception=False):
+        if ok:
+            updated += 1
+        else:
+            skipped.append(item)
+            logging.error(item)
+    logging.info(str(updated)+' document ids were stored in '+index+', '+str(len(skipped))+' were skipped')
+    return updated, skipped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='migration commands for the elasticsearch indexes')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_name_id = subparsers.add_parser('name_id', help='reindex contents with document id made from the name')
+    parser_name_id.add_argument('--source', default='contents')
+    parser_name_id.add_argument('--dest', default='contents_name_id')
+
+    parser_graph_view = subparsers.add_parser('graph_view', help='store the graph view in contents without a current one')
+    parser_graph_view.add_argument('--index', default='contents')
+    parser_graph_view.add_argument('--force', action='store_true', help='recompute the views of all contents')
+    parser_graph_view.add_argument('--layout', default='raw', help='layout of the index, raw or flat')
+
+    parser_flatten = subparsers.add_parser('flatten', help='reindex contents with the attributes in one flattened field')
+    parser_flatten.add_argument('--source', default='contents')
+    parser_flatten.add_argument('--dest', default='contents_flat')
+
+    parser_doc_id = subparsers.add_parser('doc_id', help='store the document id in '+ID_FIELD+' of documents without it')
+    parser_doc_id.add_argument('--index', default='contents')
+
+    args = parser.parse_args()
+    if args.command == 'name_id':
+        migrate_name_id(args.source, args.dest)
+    elif args.command == 'graph_view':
+        backfill_graph_view(args.index, args.force, args.layout)
+    elif args.command == 'flatten':
+        migrate_flatten(args.source, args.dest)
+    elif args.command == 'doc_id':
+        backfill_doc_id(args.index)
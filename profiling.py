@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# opt-in profiling of single requests and log of slow requests
+# a request is profiled with cProfile if X-Profile header or profile query is PROFILE_TOKEN
+# profiles are written to PROFILE_DIR and can be read with `python -m pstats <file>`
+
+import os
+import re
+import time
+import uuid
+import hmac
+import json
+import cProfile
+import logging
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = '/tmp/profiles'
+SLOW_REQUEST_SECONDS = 1.0
+
+class RequestProfiler(object):
+    # token: secret to enable profiling of a request. profiling is disabled if empty
+    # directory: where profiles are written
+    def __init__(self, token='', directory=PROFILE_DIR):
+        self._token = token
+        self._directory = directory
+
+    # request: flask request
+    def requested(self, request):
+        if not self._token:
+            return False
+        value = request.headers.get(PROFILE_HEADER) or request.args.get('profile') or ''
+        return hmac.compare_digest(value.encode('utf-8'), self._token.encode('utf-8'))
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    # stop the profile and write it. return the path
+    def stop(self, profile, name):
+        profile.disable()
+        os.makedirs(self._directory, exist_ok=True)
+        name = re.sub(r'[^0-9A-Za-z_.-]', '_', name)
+        path = os.path.join(self._directory, time.strftime('%Y%m%d-%H%M%S')+'-'+name+'-'+uuid.uuid4().hex[:8]+'.prof')
+        profile.dump_stats(path)
+        logging.info('profile was written to '+path)
+        return path
+
+# log the breakdown of metrics.end_request if the request took threshold seconds or more
+def log_slow_request(breakdown, method, path, status, threshold=SLOW_REQUEST_SECONDS):
+    if breakdown is None or breakdown['seconds'] < threshold:
+        return False
+    record = {
+        'method': method,
+        'path': path,
+        'status': status,
+        'seconds': round(breakdown['seconds'], 4),
+        'es_requests': breakdown['es_requests'],
+        'stages': {k: round(v, 4) for k, v in sorted(breakdown['stages'].items(), key=lambda x: -x[1])},
+        'sizes': breakdown['sizes'],
+    }
+    logging.warning('slow request '+json.dumps(record, ensure_ascii=False))
+    return True
+
+# profiler configured by PROFILE_TOKEN and PROFILE_DIR environment variables
+def request_profiler_from_env():
+    return RequestProfiler(token=os.environ.get('PROFILE_TOKEN', ''), directory=os.environ.get('PROFILE_DIR', PROFILE_DIR))
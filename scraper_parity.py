@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# compare extracted data of WikiScraper parser backends on stored html
+# usage: python scraper_parity.py (pages in test_data/wiki)
+#        python scraper_parity.py ./wiki_cache
+# page.json next to page.html is the expected result. --update writes it from the first parser
+# with --cleanup, compare and time text_cleanup against the previous regex code instead
+# directory arguments are read as html files in it, e.g. WIKI_CACHE_DIR
+# exit with 1 if the results of any page are different, differ from page.json or are empty
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+from wikiscraper import WikiScraper, PARSERS, STAFF_HEADLINE
+from text_cleanup import EXCEPTION, OrderedDedupDict, clean_text, tokenize_list, tokenize_infobox
+
+FIXTURES = 'test_data/wiki'
+
+def html_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.html')))
+        else:
+            files.append(path)
+    return files
+
+# return result dict and seconds to parse and extract
+def extract(html, parser, name=''):
+    start = time.perf_counter()
+    wsc = WikiScraper(parser=parser)
+    wsc.load_html(name, html)
+    wsc.get_list_from_headline(STAFF_HEADLINE)
+    wsc.get_table('infobox')
+    return wsc._result, time.perf_counter() - start
+
+# expected result of the html file
+def expected_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+def different_keys(a, b):
+    return sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+
+# update: write the result of the first parser as the expected result
+# return list of (file, {parser: seconds}, list of problems)
+# problems are keys different between parsers or from the expected result, and empty results
+def compare(files, parsers=PARSERS, update=False):
+    output = []
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        results = {}
+        times = {}
+        for parser in parsers:
+            results[parser], times[parser] = extract(html, parser, os.path.basename(path))
+        golden = results[parsers[0]]
+        problems = []
+        if len(golden) == 0:
+            problems.append('nothing extracted')
+        diff = set()
+        for parser in parsers[1:]:
+            diff.update(different_keys(golden, results[parser]))
+        if diff:
+            problems.append('different keys between parsers: ' + ', '.join(sorted(diff)))
+        if update:
+            with open(expected_path(path), 'w', encoding='utf-8') as f:
+                json.dump(golden, f, ensure_ascii=False, indent=1)
+        elif os.path.exists(expected_path(path)):
+            with open(expected_path(path), encoding='utf-8') as f:
+                expected = json.load(f)
+            diff = different_keys(expected, golden)
+            if diff:
+                problems.append('different keys from '+os.path.basename(expected_path(path))+': ' + ', '.join(diff))
+        output.append((path, times, problems))
+    return output
+
+# cleanup before text_cleanup module, kept as the reference
+def legacy_cleanup(kind, key, data, result):
+    value = []
+    data = re.sub('(［|\[).+?(］|\])','', data)
+    data = re.sub('(（|\(|\（).+?(）|\）|\))','', data)
+    data = data.strip()
+    for e in EXCEPTION:
+        if e in data:
+            value.append(e)
+            data = data.replace(e,'')
+
+    def is_katakana_or_eng(d):
+        if re.compile(r'[\u30A1-\u30F4]+').fullmatch(d) is None:
+            return False
+        return re.compile(r'^[a-zA-Z]+$').fullmatch(d) is not None
+
+    if kind == 'list':
+        data = re.split('-', data)[0]
+    else:
+        data = re.split('[※|●]', data)[0]
+    for d in re.split('[,、/／→\n]' if kind == 'list' else '[,、/→\n]', data):
+        d = d.strip()
+        if not is_katakana_or_eng(d):
+            value.extend(re.split('[・]', d))
+        else:
+            value.append(d)
+    if kind == 'list':
+        for i, v in enumerate(value):
+            value[i]  = re.split('※|●', v)[0].strip()
+
+    key = key.strip()
+    if key in result:
+        result[key].extend(value)
+        result[key] = list(set(result[key]))
+    else:
+        result[key] = value
+
+def new_cleanup(kind, key, data, result):
+    value, data = clean_text(data)
+    if kind == 'list':
+        value = tokenize_list(data, value)
+    else:
+        value = tokenize_infobox(data, value)
+    result.extend(key.strip(), value)
+
+# WikiScraper which records the input of cleanup
+class RecordingScraper(WikiScraper):
+    def __init__(self, samples, **kwargs):
+        super().__init__(**kwargs)
+        self._samples = samples
+
+    def cleanup_value_list(self, key, data):
+        self._samples.append(('list', key, data))
+        return WikiScraper.cleanup_value_list(self, key, data)
+
+    def cleanup_value_infobox(self, key, data):
+        self._samples.append(('infobox', key, data))
+        return WikiScraper.cleanup_value_infobox(self, key, data)
+
+# replay the cleanup inputs of each page to both implementations
+# values are compared as sets because the previous code did not keep the order
+# return list of (file, {implementation: seconds}, list of different keys)
+def compare_cleanup(files, repeat=20):
+    output = []
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        samples = []
+        wsc = RecordingScraper(samples)
+        wsc.load_html(os.path.basename(path), html)
+        wsc.get_list_from_headline(STAFF_HEADLINE)
+        wsc.get_table('infobox')
+
+        results = {}
+        times = {}
+        for name, cleanup, result_type in [('legacy', legacy_cleanup, dict), ('text_cleanup', new_cleanup, OrderedDedupDict)]:
+            start = time.perf_counter()
+            for i in range(repeat):
+                result = result_type()
+                for kind, key, data in samples:
+                    cleanup(kind, key, data, result)
+            times[name] = (time.perf_counter() - start) / repeat
+            results[name] = result
+        legacy, new = results['legacy'], results['text_cleanup']
+        diff = [k for k in set(legacy) | set(new) if set(legacy.get(k, [])) != set(new.get(k, []))]
+        problems = ['different keys: ' + ', '.join(sorted(diff))] if diff else []
+        if len(samples) == 0:
+            problems.append('nothing extracted')
+        output.append((path, times, problems))
+    return output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compare WikiScraper parser backends')
+    parser.add_argument('paths', nargs='*', default=[FIXTURES], help='html files or directories of html files')
+    parser.add_argument('--cleanup', action='store_true', help='compare text_cleanup with the previous code')
+    parser.add_argument('--update', action='store_true', help='write the expected result of each page')
+    args = parser.parse_args()
+
+    failed = False
+    files = html_files(args.paths)
+    if len(files) == 0:
+        print('no html files in '+', '.join(args.paths))
+        sys.exit(1)
+    results = compare_cleanup(files) if args.cleanup else compare(files, update=args.update)
+    for path, times, problems in results:
+        line = path + ' ' + ' '.join(p+': {:.1f}ms'.format(t*1000) for p, t in times.items())
+        if problems:
+            failed = True
+            line += ' FAILED ' + '; '.join(problems)
+        print(line)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# synthetic contents, user profiles and wikipedia pages for benchmarks
+# staff names are shared between contents with a long tail like the scraped data
+
+import random
+
+ROLES = ['脚本', '演出', 'プロデューサー', '音楽', '撮影', '美術', '編集', '制作', '出演者', 'ナレーター',
+         '放送期間', '放送国・地域']
+GENRES = ['バラエティ番組', 'お笑い番組', 'テレビドラマ', 'SFドラマ', 'アニメ', 'ラジオ番組', 'ドキュメンタリー']
+
+def content_name(i):
+    return 'content%d' % i
+
+# scraped data of one content
+# n_staffs: number of staff names shared by all contents
+def synthetic_data(rnd, n_staffs, roles=6, staffs_per_role=4):
+    data = {'ジャンル': [rnd.choice(GENRES)]}
+    for role in rnd.sample(ROLES, roles):
+        # lower index staffs appear in more contents
+        data[role] = ['staff%d' % int(n_staffs * rnd.random()**3) for i in range(rnd.randint(1, staffs_per_role))]
+    data['放送国・地域'] = ['日本']
+    return data
+
+# input of create_graph. dict of name: {'point', 'data'}
+def synthetic_input(n_contents, seed=0, n_staffs=None):
+    rnd = random.Random(seed)
+    if n_staffs is None:
+        n_staffs = max(10, n_contents * 3)
+    res = {}
+    for i in range(n_contents):
+        res[content_name(i)] = {
+            'point': rnd.choice([0.2, 0.25, 0.33, 0.5, 0.6, 1.0]),
+            'data': synthetic_data(rnd, n_staffs),
+        }
+    return res
+
+# user data of /users/ and /graph/get_from_data. dict of name: {'point', 'checked'}
+def synthetic_user(n_contents, seed=0):
+    rnd = random.Random(seed)
+    return {content_name(i): {'point': rnd.choice([0.2, 0.25, 0.5, 1.0]), 'checked': 1.0, 'id': -1.0} for i in range(n_contents)}
+
+PAGE_NAMES = ['佐藤太郎', '鈴木花子', 'ジョン・スミス', '山田・一郎', 'A・T・C事務所', 'Scope co.,ltd.', '高橋（たかはし）', '田中[1]',
+              '中村※ほか', 'トム']
+
+# html like a rendered wikipedia page with an infobox and a staff section
+# sections: number of sub sections of the staff section
+# rows: number of rows of the infobox
+def synthetic_page(rnd, sections=3, rows=20):
+    def people(k):
+        return '、'.join(rnd.sample(PAGE_NAMES, k))
+    infobox = ''.join('<tr><th scope="row">%s</th><td>%s<br>%s<br clear="all"/>%s &amp; co</td></tr>'
+                      % (rnd.choice(ROLES), people(2), people(1), people(1)) for i in range(rows))
+    infobox += '<tr><th>ジャンル</th><td><a href="#">%s</a><br/>コメディ</td></tr><tr><th>放送国・地域</th><td>日本</td></tr>' % rnd.choice(GENRES)
+    infobox += '<tr><td colspan="2"><table><tr><th>出演者</th><td>%s</td></tr></table></td></tr>' % people(3)
+    staff = ''
+    for s in range(sections):
+        staff += '<h3><span class="mw-headline">第%dシリーズ</span></h3><ul>' % s
+        staff += ''.join('<li>%s：%s（第1話）</li>' % (rnd.choice(ROLES), people(2)) for i in range(8))
+        staff += '<li>技術<ul><li>撮影 - %s</li><li>照明：%s</li></ul></li>' % (people(1), people(2))
+        staff += '</ul><dl><dt>音楽</dt><dd>%s</dd><dd>%s</dd></dl><p>text</p>' % (people(1), people(1))
+    return ('''<html><head><title>x</title></head><body><div id="content"><p>intro</p>
+<table class="infobox bordered">%s</table>
+<h2><span class="mw-headline" id="a">概要</span></h2><p>text</p>
+<h2><span class="mw-headline" id="s">スタッフ</span></h2>%s
+<h2><span class="mw-headline">脚注</span></h2><ul><li>ref</li></ul></div></body></html>''' % (infobox, staff))
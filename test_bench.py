@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# the benchmark suite runs offline and its comparison flags regressions
+# usage: python -m pytest -q test_bench.py
+
+import json
+
+from bench import run, compare
+
+def results(medians):
+    return {'meta': {}, 'results': {name: {'min': m, 'median': m, 'runs': 1} for name, m in medians.items()}}
+
+def test_all_suites_run_offline():
+    res = run(sizes=[10], repeat=1)
+    names = set(res['results'])
+    for suite in ['scraper.', 'graph.', 'elastic.']:
+        assert any(name.startswith(suite) for name in names), suite
+    for r in res['results'].values():
+        assert r['median'] >= 0 and r['runs'] == 1
+    json.dumps(res) # written as the results file
+
+def test_filter():
+    res = run(sizes=[10], repeat=1, filter='graph')
+    assert len(res['results']) > 0
+    assert all(name.startswith('graph.') for name in res['results'])
+
+def test_compare_flags_regressions():
+    base = results({'a': 1.0, 'b': 1.0, 'c': 1.0, 'only_base': 1.0})
+    new = results({'a': 1.1, 'b': 1.5, 'c': 0.5, 'only_new': 1.0})
+    rows = {name: (ratio, regressed) for name, b, n, ratio, regressed in compare(base, new, threshold=0.2)}
+    # only benchmarks in both results are compared
+    assert set(rows) == {'a', 'b', 'c'}
+    assert rows['b'] == (1.5, True)
+    assert not rows['a'][1] and not rows['c'][1]
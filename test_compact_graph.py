@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# CompactGraph compared with create_graph on synthetic and random inputs
+# usage: python -m pytest -q test_compact_graph.py
+
+import random
+
+import pytest
+
+from graph import create_graph
+from compact_graph import CompactGraph
+from incremental_graph import graph_diff
+from synthetic import synthetic_input
+
+# contents whose names are also attributes of others, empty values and empty genres
+def random_input(seed, n_contents=12):
+    rnd = random.Random(seed)
+    names = ['c%d' % i for i in range(n_contents)]
+    values = ['v%d' % i for i in range(15)] + names[:4] + ['', '日本']
+    keys = ['脚本', '演出', '出演者', 'ジャンル', '放送期間']
+    genres = ['バラエティ番組', 'テレビドラマ', 'SFドラマ', 'アニメ']
+    input = {}
+    for name in rnd.sample(names, rnd.randint(1, n_contents)):
+        data = {}
+        for k in rnd.sample(keys, rnd.randint(0, len(keys))):
+            data[k] = rnd.sample(genres, rnd.randint(0, 1)) if k == 'ジャンル' else [rnd.choice(values) for i in range(rnd.randint(0, 4))]
+        input[name] = {'point': rnd.choice([0.2, 0.25, 0.5, 1.0]), 'data': data}
+    return input
+
+def assert_same(input, merge=True):
+    G = create_graph(input, merge=merge)
+    cg = CompactGraph.from_input(input, merge=merge)
+    assert graph_diff(cg.to_networkx(), G) == []
+    assert list(cg.nodes_dict()) == list(G.nodes)
+    assert cg.edge_list() == list(G.edges)
+    assert cg.edge_relations() == [G.edges[e]['relation'] for e in G.edges]
+
+@pytest.mark.parametrize('size', [1, 10, 300])
+def test_synthetic_input(size):
+    assert_same(synthetic_input(size))
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_input(seed):
+    assert_same(random_input(seed))
+
+def test_without_merge():
+    assert_same(synthetic_input(50), merge=False)
+    assert_same(random_input(0), merge=False)
+
+def test_empty_input():
+    cg = CompactGraph.from_input({})
+    assert len(cg) == 0
+    assert cg.edge_list() == []
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# graph of the aggregation of graph views compared with the graph of fetched contents
+# elasticsearch is es_stub.InMemoryElasticsearch
+# usage: python -m pytest -q test_graph_aggregation.py
+
+import pytest
+
+from elastic_util import ElasticUtilNameId
+from es_stub import InMemoryElasticsearch
+from graph import pre_create_graph, create_graph, graph_view_field, graph_views_from_buckets, \
+    VIEW_KEY, VIEW_MAPPING, VIEW_EDGES_FIELD, VIEW_SOURCE_FIELDS
+from incremental_graph import graph_diff
+from synthetic import synthetic_input
+
+INPUT = synthetic_input(40)
+POINTS = {name: c['point'] for name, c in INPUT.items()}
+
+def contents(layout, id_mode='search', mappings=VIEW_MAPPING):
+    es = InMemoryElasticsearch()
+    eu = ElasticUtilNameId('contents', client=es, id_mode=id_mode, view=graph_view_field, layout=layout, mappings=mappings)
+    eu.bulk_post({name: dict(c['data']) for name, c in INPUT.items()})
+    return es, eu
+
+# graph of load_contents of the api
+def fetched_graph(eu, points):
+    res, code = eu.get_list(points.keys())
+    return create_graph(pre_create_graph(points, {name: doc['_source'] for name, doc in res['found'].items()}))
+
+# graph of load_graph_contents of the api. stale contents are fetched
+def aggregated_graph(eu, points):
+    res = eu.aggregate(points.keys(), VIEW_EDGES_FIELD, VIEW_SOURCE_FIELDS)
+    assert res is not None
+    data, stale = graph_views_from_buckets(res['hits'], res['buckets'])
+    found, code = eu.get_list(stale)
+    data.update({name: doc['_source'] for name, doc in found['found'].items()})
+    return create_graph(pre_create_graph(points, data)), stale
+
+@pytest.mark.parametrize('layout', ['raw', 'flat'])
+@pytest.mark.parametrize('id_mode', ['search', 'name'])
+def test_aggregation_matches_fetch(layout, id_mode):
+    es, eu = contents(layout, id_mode)
+    G, stale = aggregated_graph(eu, POINTS)
+    assert stale == []
+    assert len(G) > len(POINTS)
+    assert graph_diff(G, fetched_graph(eu, POINTS)) == []
+
+@pytest.mark.parametrize('layout', ['raw', 'flat'])
+def test_outdated_views_are_fetched(layout):
+    es, eu = contents(layout)
+    names = sorted(POINTS)[:10]
+    for doc in es.indexes['contents'].values():
+        if doc['_source']['name'] in names:
+            doc['_source'][VIEW_KEY]['version'] = 1
+    G, stale = aggregated_graph(eu, POINTS)
+    assert sorted(stale) == names
+    assert graph_diff(G, fetched_graph(eu, POINTS)) == []
+
+def test_long_edge_is_aggregated():
+    es, eu = contents('raw')
+    name = sorted(POINTS)[0]
+    eu.put(name, dict(INPUT[name]['data'], **{'役職'*200: ['名前']}))
+    G, stale = aggregated_graph(eu, POINTS)
+    assert '名前' in G
+    assert graph_diff(G, fetched_graph(eu, POINTS)) == []
+
+# edges mapped dynamically, as text with a .keyword subfield with ignore_above, would drop long edges
+def test_ignore_above_keyword_falls_back():
+    es, eu = contents('raw', mappings=None)
+    mapping = es.indices.get_field_mapping([VIEW_EDGES_FIELD+'.keyword'], 'contents')
+    assert 'ignore_above' in mapping['contents']['mappings'][VIEW_EDGES_FIELD+'.keyword']['mapping']['keyword']
+    assert eu.aggregate(POINTS.keys(), VIEW_EDGES_FIELD, VIEW_SOURCE_FIELDS) is None
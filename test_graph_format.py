@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# compact graph format and the negotiation of mimetype and encoding
+# the fallback to json and gzip is tested with msgpack and brotli removed
+# usage: python -m pytest -q test_graph_format.py
+
+import gzip
+import json
+
+import pytest
+from werkzeug.datastructures import Accept, MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import graph_format
+from graph_format import to_compact, from_compact, negotiate_mimetype, negotiate_encoding, encode, compress, \
+    JSON_MIMETYPE, MSGPACK_MIMETYPE
+from graph import create_graph
+from synthetic import synthetic_input
+
+def accept(value):
+    return parse_accept_header(value, MIMEAccept)
+
+def accept_encoding(value):
+    return parse_accept_header(value, Accept)
+
+@pytest.fixture
+def without_optional(monkeypatch):
+    monkeypatch.setattr(graph_format, 'msgpack', None)
+    monkeypatch.setattr(graph_format, 'brotli', None)
+
+def test_compact_round_trip():
+    G = create_graph(synthetic_input(30))
+    nodes = dict(G.nodes)
+    edges = list(G.edges)
+    relations = [G.edges[e]['relation'] for e in edges]
+    assert from_compact(to_compact(nodes, edges, relations)) == (nodes, edges, relations)
+    assert from_compact(to_compact(nodes, edges)) == (nodes, edges, None)
+
+@pytest.mark.parametrize('value, mimetype', [
+    ('', JSON_MIMETYPE),
+    ('application/json', JSON_MIMETYPE),
+    ('text/html,application/xhtml+xml', JSON_MIMETYPE), # browsers
+    ('application/json;q=0', None),
+    ('*/*;q=0', None),
+])
+def test_mimetype(value, mimetype):
+    assert negotiate_mimetype(accept(value)) == mimetype
+
+def test_msgpack_falls_back_to_json(without_optional):
+    assert negotiate_mimetype(accept(MSGPACK_MIMETYPE)) == JSON_MIMETYPE
+    assert negotiate_mimetype(accept(MSGPACK_MIMETYPE+','+JSON_MIMETYPE+';q=0.5')) == JSON_MIMETYPE
+
+def test_brotli_falls_back_to_gzip(without_optional):
+    assert negotiate_encoding(accept_encoding('br, gzip')) == 'gzip'
+    assert negotiate_encoding(accept_encoding('br')) is None
+
+def test_json_and_gzip():
+    body = {'nodes': {'名前': {'genre': 'attribute', 'point': 0.5}}}
+    data = encode(body, JSON_MIMETYPE)
+    assert json.loads(data.decode('utf-8')) == body
+    assert gzip.decompress(compress(data, 'gzip')) == data
+    assert compress(data, None) == data
+
+def test_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    assert negotiate_mimetype(accept(MSGPACK_MIMETYPE+','+JSON_MIMETYPE+';q=0.5')) == MSGPACK_MIMETYPE
+    body = to_compact({'a': {'genre': 'attribute', 'point': 1.0}}, [])
+    assert msgpack.unpackb(encode(body, MSGPACK_MIMETYPE), raw=False) == body
+
+def test_brotli():
+    brotli = pytest.importorskip('brotli')
+    assert negotiate_encoding(accept_encoding('gzip, br')) == 'br'
+    data = encode({'a': 1})
+    assert brotli.decompress(compress(data, 'br')) == data
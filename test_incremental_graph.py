@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# IncrementalGraph compared with create_graph, and UserGraphs with contents written by other processes
+# elasticsearch is es_stub.InMemoryElasticsearch
+# usage: python -m pytest -q test_incremental_graph.py
+
+import pytest
+
+import graph
+import incremental_graph
+from incremental_graph import UserGraphs, check, graph_diff
+from graph import pre_create_graph, create_graph
+from content_cache import ContentCache, doc_version
+from elastic_util import ElasticUtilNameId
+from es_stub import InMemoryElasticsearch
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_random_operations_match_create_graph(seed):
+    assert check(runs=100, seed=seed) == 0
+
+def test_random_operations_match_create_graph_without_count_once(monkeypatch):
+    monkeypatch.setattr(graph, 'count_once', False)
+    monkeypatch.setattr(incremental_graph, 'count_once', False)
+    assert check(runs=100, seed=3) == 0
+
+# load of UserGraphs.update from eu. names of each call are kept in calls
+def loader(eu, calls):
+    def load(points):
+        calls.append(sorted(points))
+        res, code = eu.get_list(points.keys())
+        data = {name: doc['_source'] for name, doc in res['found'].items()}
+        versions = {name: doc_version(doc) for name, doc in res['found'].items()}
+        return {name: point for name, point in points.items() if name in data}, data, versions
+    return load
+
+# with a content cache, which serves the old document until its version is checked
+@pytest.fixture(params=[None, 'cache'])
+def contents(request):
+    es = InMemoryElasticsearch()
+    # two processes with their own ElasticUtilNameId, so no listener of the other is called
+    cache = ContentCache(verify_after=60) if request.param == 'cache' else None
+    this = ElasticUtilNameId('contents', client=es, cache=cache)
+    other = ElasticUtilNameId('contents', client=es)
+    this.post('A', {'ジャンル': ['テレビドラマ'], '脚本': ['x']})
+    this.post('B', {'ジャンル': ['テレビドラマ'], '脚本': ['x'], '演出': ['z']})
+    return this, other
+
+def expected_graph(eu, points):
+    res, code = eu.get_list(points.keys())
+    return create_graph(pre_create_graph(points, {name: doc['_source'] for name, doc in res['found'].items()}))
+
+def test_content_written_by_other_process_is_loaded_again(contents):
+    this, other = contents
+    calls = []
+    user_graphs = UserGraphs()
+    points = {'A': 1.0, 'B': 0.5}
+    G = user_graphs.update('user', points, loader(this, calls), versions=this.versions)
+    assert graph_diff(G, expected_graph(this, points)) == []
+
+    other.put('A', {'ジャンル': ['テレビドラマ'], '脚本': ['x', 'y']})
+    G = user_graphs.update('user', points, loader(this, calls), versions=this.versions)
+    assert 'y' in G
+    assert graph_diff(G, expected_graph(this, points)) == []
+    # B has the same version and is not loaded again
+    assert calls == [['A', 'B'], ['A']]
+
+def test_point_change_without_write_is_not_loaded(contents):
+    this, other = contents
+    calls = []
+    user_graphs = UserGraphs()
+    user_graphs.update('user', {'A': 1.0, 'B': 0.5}, loader(this, calls), versions=this.versions)
+    points = {'A': 0.25, 'B': 0.5}
+    G = user_graphs.update('user', points, loader(this, calls), versions=this.versions)
+    assert graph_diff(G, expected_graph(this, points)) == []
+    assert calls == [['A', 'B']]
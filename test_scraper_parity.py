@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# parity of the WikiScraper parser backends, text_cleanup and the fetch modes on the pages in test_data/wiki
+# usage: python -m pytest -q test_scraper_parity.py
+
+import os
+import re
+import json
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from bs4 import BeautifulSoup
+
+from scraper_parity import html_files, compare, compare_cleanup, FIXTURES
+from wiki_cache import WikiCache
+from wiki_client import WikiClient
+from wikiscraper import WikiScraper
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FILES = html_files([os.path.join(HERE, FIXTURES)])
+
+def test_fixtures_have_expected_results():
+    assert len(FILES) > 0
+    for path in FILES:
+        assert os.path.exists(os.path.splitext(path)[0] + '.json'), path
+
+@pytest.mark.parametrize('path', FILES, ids=os.path.basename)
+def test_parsers_match_expected(path):
+    for path, times, problems in compare([path]):
+        assert problems == []
+
+@pytest.mark.parametrize('path', FILES, ids=os.path.basename)
+def test_cleanup_matches_legacy(path):
+    for path, times, problems in compare_cleanup([path], repeat=1):
+        assert problems == []
+
+# a page without infobox and staff sections, like the graph page, is not a pass
+def test_empty_extraction_fails():
+    path, times, problems = compare([os.path.join(HERE, 'test_data', 'result.html')])[0]
+    assert 'nothing extracted' in problems
+
+# sections of the page like the mediawiki parse api: list of (section info, html)
+# section 0 is the lead before the first headline. a section has its subsections
+def page_sections(html):
+    # the element with the headings, like div.mw-parser-output
+    root = BeautifulSoup(html, 'html.parser').find(class_='mw-headline').parent.parent
+    children = [c for c in root.children]
+    headings = [i for i, c in enumerate(children) if c.name is not None and re.match('h[2-6]$', c.name)
+                and c.find(class_='mw-headline') is not None]
+    sections = [({'index': '0', 'number': '', 'level': '1', 'line': ''}, ''.join(str(c) for c in children[:headings[0]]))]
+    counters = []
+    for n, i in enumerate(headings):
+        level = int(children[i].name[1])
+        end = next((j for j in headings[n+1:] if int(children[j].name[1]) <= level), len(children))
+        depth = level - 1
+        counters = counters[:depth] + [0] * (depth - len(counters))
+        counters[depth-1] += 1
+        info = {'index': str(n+1), 'number': '.'.join(str(c) for c in counters if c), 'level': str(level),
+                'line': children[i].find(class_='mw-headline').decode_contents()}
+        sections.append((info, ''.join(str(c) for c in children[i:end])))
+    return sections
+
+# local wikipedia with the page at every title and its sections in the parse api
+class ParseApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path.startswith('/wiki/'):
+            body, content_type = self.server.page, 'text/html; charset=UTF-8'
+        else:
+            params = dict(urllib.parse.parse_qsl(url.query))
+            sections = page_sections(self.server.page)
+            if params.get('prop') == 'sections':
+                parse = {'sections': [info for info, html in sections[1:]]}
+            else:
+                parse = {'text': '<div class="mw-parser-output">'+sections[int(params['section'])][1]+'</div>'}
+            body, content_type = json.dumps({'parse': parse}), 'application/json'
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ParseApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+# load of the sections mode is the same as the page mode
+@pytest.mark.parametrize('path', FILES, ids=os.path.basename)
+def test_sections_match_page(path, server, tmp_path):
+    with open(path, encoding='utf-8') as f:
+        server.page = f.read()
+    host = 'http://127.0.0.1:%d' % server.server_address[1]
+    client = WikiClient(base_url=host+'/wiki/', api_url=host+'/w/api.php', rate=0, retries=0)
+    results = {}
+    for mode in ['page', 'sections']:
+        wsc = WikiScraper(cache=WikiCache(str(tmp_path / mode)), client=client, fetch_mode=mode)
+        ok, results[mode] = wsc.load('ページ')
+        assert ok
+    assert len(results['page']) > 0
+    assert results['sections'] == results['page']
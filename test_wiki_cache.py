@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# offline checks of WikiCache and the cached fetch of WikiScraper
+# wikipedia is a local server which answers with ETag and 304 Not Modified
+# usage: python -m pytest -q test_wiki_cache.py
+
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pytest
+
+from wiki_cache import WikiCache, cache_key
+from wiki_client import WikiClient
+from wikiscraper import WikiScraper
+
+PAGE = '<html><body><p>page</p></body></html>'
+ETAG = '"v1"'
+
+# local wikipedia. every title has PAGE with ETAG
+class RevalidatingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RevalidatingHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def scraper(server, cache):
+    client = WikiClient(base_url='http://127.0.0.1:%d/wiki/' % server.server_address[1], rate=0, retries=0)
+    return WikiScraper(cache=cache, client=client, fetch_mode='page')
+
+def test_miss_and_hit(tmp_path):
+    cache = WikiCache(str(tmp_path))
+    assert cache.get('ja', 'page') is None
+    cache.put('ja', 'page', np.nan, PAGE, url='http://example/page', headers={'ETag': ETAG})
+    html, meta, fresh = cache.get('ja', 'page')
+    assert html == PAGE and fresh
+    assert meta['etag'] == ETAG
+    # title, page id and variant are separate entries
+    assert cache.get('ja', 'page', variant='sections') is None
+    assert cache.get('en', 'page') is None
+    assert cache_key('ja', '', 10) != cache_key('ja', 'page')
+
+def test_ttl_expiry(tmp_path):
+    cache = WikiCache(str(tmp_path), ttl=0.2)
+    cache.put('ja', 'page', np.nan, PAGE)
+    assert cache.get('ja', 'page')[2]
+    time.sleep(0.3)
+    html, meta, fresh = cache.get('ja', 'page')
+    assert html == PAGE and not fresh
+    cache.refresh('ja', 'page')
+    assert cache.get('ja', 'page')[2]
+
+def test_eviction_of_least_recently_used(tmp_path):
+    size = len(PAGE.encode('utf-8'))
+    cache = WikiCache(str(tmp_path), max_bytes=size*2)
+    cache.put('ja', 'old', np.nan, PAGE)
+    time.sleep(0.05)
+    cache.put('ja', 'used', np.nan, PAGE)
+    time.sleep(0.05)
+    cache.get('ja', 'old') # touch
+    time.sleep(0.05)
+    cache.put('ja', 'new', np.nan, PAGE)
+    assert cache.get('ja', 'used') is None
+    assert cache.get('ja', 'old') is not None
+    assert cache.get('ja', 'new') is not None
+
+def test_fetch_revalidates_with_304(tmp_path, server):
+    cache = WikiCache(str(tmp_path), ttl=0.2)
+    wsc = scraper(server, cache)
+    assert wsc.fetch('page') == PAGE
+    assert len(server.requests) == 1
+    # fresh entry is served without a request
+    assert wsc.fetch('page') == PAGE
+    assert len(server.requests) == 1
+    # expired entry is revalidated and kept on 304
+    time.sleep(0.3)
+    assert wsc.fetch('page') == PAGE
+    assert len(server.requests) == 2
+    assert server.requests[1].get('If-None-Match') == ETAG
+    assert server.requests[1].get('If-Modified-Since') == 'Mon, 01 Jan 2024 00:00:00 GMT'
+    assert cache.get('ja', 'page')[2]
+
+def test_offline_cache(tmp_path, server):
+    WikiCache(str(tmp_path), ttl=0.01).put('ja', 'page', np.nan, PAGE)
+    time.sleep(0.05)
+    wsc = scraper(server, WikiCache(str(tmp_path), ttl=0.01, offline=True))
+    # expired entry is used as is and missing entry is an error, without requests
+    assert wsc.fetch('page') == PAGE
+    with pytest.raises(IOError):
+        wsc.fetch('missing')
+    assert len(server.requests) == 0
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# offline checks of the retries and the rate limit of WikiClient
+# wikipedia is a local server which fails a given number of times before it answers
+# usage: python -m pytest -q test_wiki_client.py
+
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from wiki_client import WikiClient, TokenBucket
+
+# local wikipedia. the first server.failures requests of each path get server.fail_status, with Retry-After of server.retry_after if set
+class FlakyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, time.monotonic()))
+            count = sum(1 for path, t in self.server.requests if path == self.path)
+        if count <= self.server.failures:
+            self.send_response(self.server.fail_status)
+            if self.server.retry_after:
+                self.send_header('Retry-After', self.server.retry_after)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    server.requests = []
+    server.lock = threading.Lock()
+    server.failures = 0
+    server.fail_status = 503
+    server.retry_after = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def client(server, **kwargs):
+    kwargs.setdefault('rate', 0)
+    kwargs.setdefault('backoff', 0)
+    return WikiClient(base_url='http://127.0.0.1:%d/wiki/' % server.server_address[1], **kwargs)
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retry_until_success(server, status):
+    server.failures = 2
+    server.fail_status = status
+    r = client(server, retries=3).get(client(server).page_url('page'))
+    assert r.status_code == 200
+    assert r.text == '/wiki/page'
+    assert len(server.requests) == 3
+
+def test_retries_exhausted(server):
+    server.failures = 10
+    r = client(server, retries=2).get(client(server).page_url('page'))
+    # the last response is returned instead of raising
+    assert r.status_code == 503
+    assert len(server.requests) == 3
+
+def test_no_retry_of_client_error(server):
+    server.failures = 1
+    server.fail_status = 404
+    r = client(server, retries=3).get(client(server).page_url('page'))
+    assert r.status_code == 404
+    assert len(server.requests) == 1
+
+def test_backoff(server):
+    server.failures = 2
+    start = time.monotonic()
+    client(server, retries=3, backoff=0.1).get(client(server).page_url('page'))
+    # sleeps before the second retry at least, 0.2 seconds
+    assert time.monotonic() - start >= 0.2
+
+def test_retries_take_tokens(server):
+    server.failures = 2
+    start = time.monotonic()
+    r = client(server, retries=2, rate=10, burst=1).get(client(server).page_url('page'))
+    assert r.status_code == 200
+    # the first request of the burst and 2 retries at 10 per second
+    assert time.monotonic() - start >= 0.18
+
+def test_retry_after(server):
+    server.failures = 1
+    server.retry_after = '1'
+    start = time.monotonic()
+    r = client(server, retries=1).get(client(server).page_url('page'))
+    assert r.status_code == 200
+    assert time.monotonic() - start >= 1.0
+
+def test_connection_error_after_retries():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close() # nothing listens on the port
+    wiki = WikiClient(base_url='http://127.0.0.1:%d/wiki/' % port, rate=0, retries=2, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        wiki.get(wiki.page_url('page'))
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    for i in range(6):
+        bucket.acquire()
+    # 2 tokens of the burst and 4 more at 20 per second
+    assert 0.18 <= time.monotonic() - start < 1.0
+
+def test_rate_limit_of_threads(server):
+    wiki = client(server, rate=20, burst=1)
+    urls = [wiki.page_url('page%d' % i) for i in range(6)]
+    start = time.monotonic()
+    threads = [threading.Thread(target=wiki.get, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times = sorted(t for path, t in server.requests)
+    assert len(times) == 6
+    # one request of the burst and 5 more at 20 per second from all threads
+    assert times[-1] - start >= 0.23
+
+def test_get_many_keeps_order(server):
+    server.failures = 1
+    wiki = client(server, retries=1)
+    res = wiki.get_many([wiki.page_url('page%d' % i) for i in range(5)])
+    assert [r.text for r in res] == ['/wiki/page%d' % i for i in range(5)]
+    wiki.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# normalization and tokenizer of scraped staff names
+# regex are compiled once and exception names are matched with one regex scan
+
+import re
+
+# todo handle English+漢字, '-.,' in the name
+EXCEPTION = ['A・T・C事務所','Scope co.,ltd.', '4-Legs',  'オア・グローリー神宮前店', 'インダストリアル・ライト&マジック']
+
+RE_SQUARE_BRACKET = re.compile(r'(［|\[).+?(］|\])')
+RE_ROUND_BRACKET = re.compile(r'(（|\(|\（).+?(）|\）|\))')
+RE_LIST_SEPARATOR = re.compile(r'[,、/／→\n]')
+RE_INFOBOX_SEPARATOR = re.compile(r'[,、/→\n]')
+RE_LIST_NOTE = re.compile(r'※|●')
+RE_INFOBOX_NOTE = re.compile(r'[※|●]')
+RE_KATAKANA = re.compile(r'[\u30A1-\u30F4]+')
+RE_ROMAN = re.compile(r'^[a-zA-Z]+$') #a-z:小文字、A-Z:大文字
+
+# matcher of exception names
+# one regex scan tells if any exception is in the data, which is rare
+class ExceptionMatcher(object):
+    def __init__(self, names):
+        self._names = list(names)
+        self._re = re.compile('|'.join(re.escape(n) for n in sorted(self._names, key=len, reverse=True)))
+
+    # return found exception names and data without them
+    def extract(self, data):
+        found = []
+        if self._re.search(data) is None:
+            return found, data
+        # same order and replacement as scanning all names
+        for e in self._names:
+            if e in data:
+                found.append(e)
+                data = data.replace(e, '')
+        return found, data
+
+EXCEPTION_MATCHER = ExceptionMatcher(EXCEPTION)
+
+# dict of key: list of values without duplicated values in insertion order
+class OrderedDedupDict(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._seen = {k: set(v) for k, v in self.items()}
+
+    def extend(self, key, values):
+        if key not in self:
+            self[key] = []
+            self._seen[key] = set()
+        seen = self._seen[key]
+        target = self[key]
+        for v in values:
+            if v not in seen:
+                seen.add(v)
+                target.append(v)
+
+# return true if data include only Katakana and alphabet
+# note: data has to match both katakana and roman, so this is False for all data.
+# kept as is because the scraped data depends on it
+def is_katakana_or_eng(data):
+    if RE_KATAKANA.fullmatch(data) is None:
+        return False
+    if RE_ROMAN.fullmatch(data) is None:
+        return False
+    return True
+
+# remove brackets, blank, and \n and pick up exception names
+# return list of exception names and cleaned data
+def clean_text(data):
+    data = RE_SQUARE_BRACKET.sub('', data) #remove brackets
+    data = RE_ROUND_BRACKET.sub('', data) #remove brackets
+    data = data.strip()  #remove \n, and blank from head and tail
+    return EXCEPTION_MATCHER.extract(data)
+
+def split_staffs(data, separator, value):
+    for d in separator.split(data): #separate multiple staffs
+        d = d.strip()
+        if not is_katakana_or_eng(d): #separate with '・' for ウレロシリーズ
+            value.extend(d.split('・'))
+        else:
+            value.append(d) # do not separate with '・' for foregin people
+    return value
+
+# separate line of list with , / -> and etc.
+def tokenize_list(data, value):
+    data = data.split('-', 1)[0]
+    value = split_staffs(data, RE_LIST_SEPARATOR, value)
+    for i, v in enumerate(value): #remove ※
+        value[i] = RE_LIST_NOTE.split(v, 1)[0].strip()
+    return value
+
+# separate value of infobox with , / -> and etc.
+def tokenize_infobox(data, value):
+    data = RE_INFOBOX_NOTE.split(data, 1)[0]
+    return split_staffs(data, RE_INFOBOX_SEPARATOR, value)
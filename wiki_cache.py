@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# disk cache of fetched wikipedia pages
+# each entry is <key>.html and <key>.json (url, ETag, Last-Modified and fetch time)
+# key is sha1 of (lang, title) or (lang, pageid), and variant of the html such as 'sections'
+# usage to seed an entry for offline run:
+#   python wiki_cache.py seed ./wiki_cache 勇者ヨシヒコと魔王の城 test_data/result.html
+
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+
+WIKI_CACHE_TTL = 7*24*60*60 # seconds until an entry is revalidated
+WIKI_CACHE_MAX_BYTES = 512*1024*1024
+
+# dictionary key of lang and title or page id
+# variant: kind of html if it is not the full page
+def cache_key(lang, name='', pageid=np.nan, variant=''):
+    if name:
+        source = lang + ':title:' + name
+    else:
+        source = lang + ':pageid:' + str(int(pageid))
+    if variant:
+        source += ':' + variant
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+class WikiCache(object):
+    # cache_dir: directory of cache files
+    # ttl: seconds until an entry expires and needs revalidation
+    # max_bytes: total size of html files. least recently used entries are removed
+    # offline: use entries regardless of ttl and never fetch
+    def __init__(self, cache_dir, ttl=WIKI_CACHE_TTL, max_bytes=WIKI_CACHE_MAX_BYTES, offline=False):
+        self._dir = cache_dir
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._offline = offline
+        self._lock = threading.Lock()
+        os.makedirs(self._dir, exist_ok=True)
+        self._total_bytes = sum(size for key, size, used in self._entries())
+
+    @property
+    def offline(self):
+        return self._offline
+
+    def _path(self, key, ext):
+        return os.path.join(self._dir, key + ext)
+
+    # list of (key, size, last used time) of html files
+    def _entries(self):
+        entries = []
+        for e in os.scandir(self._dir):
+            if e.name.endswith('.html'):
+                try:
+                    stat = e.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((e.name[:-len('.html')], stat.st_size, stat.st_mtime))
+        return entries
+
+    # return html, meta and fresh flag. None if there is no entry
+    def get(self, lang, name='', pageid=np.nan, variant=''):
+        key = cache_key(lang, name, pageid, variant)
+        try:
+            with open(self._path(key, '.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self._path(key, '.html'), encoding='utf-8') as f:
+                html = f.read()
+        except (OSError, ValueError):
+            return None
+        self._touch(key)
+        fresh = self._offline or time.time() - meta['fetched_at'] < self._ttl
+        return html, meta, fresh
+
+    # headers for revalidation of the expired entry
+    def conditional_headers(self, meta):
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    # add or replace entry
+    # headers: response headers to save ETag and Last-Modified
+    def put(self, lang, name, pageid, html, url='', headers={}, variant=''):
+        key = cache_key(lang, name, pageid, variant)
+        meta = {
+            'url': url,
+            'lang': lang,
+            'name': name,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        data = html.encode('utf-8')
+        with self._lock:
+            old_size = self._size(key)
+            self._write(self._path(key, '.html'), data)
+            self._write(self._path(key, '.json'), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self._max_bytes:
+                self._evict()
+
+    # mark the expired entry as fresh after 304 Not Modified
+    def refresh(self, lang, name='', pageid=np.nan, variant=''):
+        key = cache_key(lang, name, pageid, variant)
+        try:
+            with open(self._path(key, '.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        meta['fetched_at'] = time.time()
+        self._write(self._path(key, '.json'), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def _size(self, key):
+        try:
+            return os.path.getsize(self._path(key, '.html'))
+        except OSError:
+            return 0
+
+    # write to temporary file and rename to avoid partial file for concurrent reader
+    def _write(self, path, data):
+        temp = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    # update last used time for LRU
+    def _touch(self, key):
+        try:
+            os.utime(self._path(key, '.html'))
+        except OSError:
+            pass
+
+    # remove least recently used entries until the total size is under max_bytes
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for key, size, used in entries)
+        for key, size, used in entries:
+            if total <= self._max_bytes:
+                break
+            for ext in ['.html', '.json']:
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            total -= size
+            logging.info('wiki cache evicted: '+key)
+        self._total_bytes = total
+
+_default_cache = None
+
+# cache configured by WIKI_CACHE_DIR, WIKI_CACHE_TTL, WIKI_CACHE_MAX_BYTES and WIKI_CACHE_OFFLINE
+# None if WIKI_CACHE_DIR is not set
+def get_default_cache():
+    global _default_cache
+    cache_dir = os.environ.get('WIKI_CACHE_DIR', '')
+    if cache_dir == '':
+        return None
+    if _default_cache is None:
+        _default_cache = WikiCache(cache_dir,
+                                   ttl=float(os.environ.get('WIKI_CACHE_TTL', WIKI_CACHE_TTL)),
+                                   max_bytes=int(os.environ.get('WIKI_CACHE_MAX_BYTES', WIKI_CACHE_MAX_BYTES)),
+                                   offline=os.environ.get('WIKI_CACHE_OFFLINE', '') not in ['', '0', 'false'])
+    return _default_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='wikipedia page cache')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_seed = subparsers.add_parser('seed', help='add html file to the cache for offline run')
+    parser_seed.add_argument('cache_dir')
+    parser_seed.add_argument('name', help='title of wikipage')
+    parser_seed.add_argument('html', help='html file')
+    parser_seed.add_argument('--lang', default='ja')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        with open(args.html, encoding='utf-8') as f:
+            html = f.read()
+        WikiCache(args.cache_dir).put(args.lang, args.name, np.nan, html, url='file:'+args.html)
+        print(args.name + ' was added to ' + args.cache_dir)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# shared http client for wikipedia fetches
+# keep-alive connection pool, timeouts, retries with backoff and global rate limit
+
+import os
+import time
+import urllib.parse
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+WIKI_BASE_URL = 'https://{lang}.wikipedia.org/wiki/'
+WIKI_API_URL = 'https://{lang}.wikipedia.org/w/api.php'
+WIKI_CONNECT_TIMEOUT = 3.05 # seconds
+WIKI_READ_TIMEOUT = 10.0 # seconds
+WIKI_RETRIES = 3
+WIKI_BACKOFF = 0.5 # sleep backoff * 2^(retry-1) seconds between retries
+WIKI_RATE = 10.0 # requests per second for all threads
+WIKI_BURST = 10
+WIKI_POOL_SIZE = 10
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+# token bucket shared by threads
+# rate: tokens added per second
+# burst: max tokens
+class TokenBucket(object):
+    def __init__(self, rate, burst):
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    # block until a token is available
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+class WikiClient(object):
+    # base_url: url of wikipage without title. {lang} is replaced with language
+    # rate: requests per second, no limit if 0
+    def __init__(self, base_url=WIKI_BASE_URL, api_url=WIKI_API_URL, connect_timeout=WIKI_CONNECT_TIMEOUT, read_timeout=WIKI_READ_TIMEOUT,
+                 retries=WIKI_RETRIES, backoff=WIKI_BACKOFF, rate=WIKI_RATE, burst=WIKI_BURST, pool_size=WIKI_POOL_SIZE):
+        self._base_url = base_url
+        self._api_url = api_url
+        self._timeout = (connect_timeout, read_timeout)
+        self._retries = retries
+        self._backoff = backoff
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+        # retries are done in get, not in the adapter, so that each attempt takes a token
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def page_url(self, name, lang='ja'):
+        return self._base_url.format(lang=lang) + name
+
+    # url of mediawiki api with query parameters
+    def api_url(self, params, lang='ja'):
+        return self._api_url.format(lang=lang) + '?' + urllib.parse.urlencode(params)
+
+    # get json of mediawiki api. raise IOError for api error
+    def get_api(self, params, lang='ja'):
+        r = self.get(self.api_url(params, lang))
+        r.raise_for_status()
+        res = r.json()
+        if 'error' in res:
+            raise IOError(res['error'].get('info', 'mediawiki api error'))
+        return res
+
+    # get with rate limit and retries of connection errors, timeouts and RETRY_STATUS
+    # every attempt takes a token. the last response is returned if the retries are exhausted
+    def get(self, url, headers={}):
+        for retry in range(self._retries + 1):
+            if retry > 0:
+                time.sleep(self._retry_wait(retry, r))
+            if self._bucket is not None:
+                self._bucket.acquire()
+            try:
+                r = self._session.get(url, headers=headers, timeout=self._timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if retry == self._retries:
+                    raise
+                r = None
+                continue
+            if r.status_code not in RETRY_STATUS or retry == self._retries:
+                return r
+            r.close()
+
+    # seconds before the retry. Retry-After in seconds of the last response is honoured
+    def _retry_wait(self, retry, r):
+        wait = self._backoff * 2 ** (retry - 1)
+        retry_after = r.headers.get('Retry-After', '') if r is not None else ''
+        if retry_after.isdigit():
+            wait = max(wait, int(retry_after))
+        return wait
+
+    # async version of get for batch callers. requests run in the thread pool of pool_size
+    async def get_async(self, url, headers={}):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.get(url, headers))
+
+    # get multiple urls concurrently. return list of response or exception in the order of urls
+    async def get_many_async(self, urls, headers={}):
+        return await asyncio.gather(*[self.get_async(url, headers) for url in urls], return_exceptions=True)
+
+    def get_many(self, urls, headers={}):
+        return asyncio.run(self.get_many_async(urls, headers))
+
+    def close(self):
+        self._session.close()
+        self._executor.shutdown(wait=False)
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+# client shared in the process, configured by WIKI_* environment variables
+def get_default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WikiClient(
+                base_url=os.environ.get('WIKI_BASE_URL', WIKI_BASE_URL),
+                api_url=os.environ.get('WIKI_API_URL', WIKI_API_URL),
+                connect_timeout=float(os.environ.get('WIKI_CONNECT_TIMEOUT', WIKI_CONNECT_TIMEOUT)),
+                read_timeout=float(os.environ.get('WIKI_READ_TIMEOUT', WIKI_READ_TIMEOUT)),
+                retries=int(os.environ.get('WIKI_RETRIES', WIKI_RETRIES)),
+                backoff=float(os.environ.get('WIKI_BACKOFF', WIKI_BACKOFF)),
+                rate=float(os.environ.get('WIKI_RATE', WIKI_RATE)),
+                burst=int(os.environ.get('WIKI_BURST', WIKI_BURST)),
+                pool_size=int(os.environ.get('WIKI_POOL_SIZE', WIKI_POOL_SIZE)))
+    return _default_client
@@ -1,11 +1,38 @@
+import os
 import re
+import logging
 import numpy as np
 import bs4.element as bs4elem
 from bs4 import BeautifulSoup
-import requests
+from bs4.builder import builder_registry
+from wiki_cache import get_default_cache
+from wiki_client import get_default_client
+from metrics import stage
+from single_flight import SingleFlight
+from text_cleanup import OrderedDedupDict, is_katakana_or_eng, clean_text, tokenize_list, tokenize_infobox
 
-# todo handle English+漢字, '-.,' in the name
-EXCEPTION = ['A・T・C事務所','Scope co.,ltd.', '4-Legs',  'オア・グローリー神宮前店', 'インダストリアル・ライト&マジック']
+# html parser backend of BeautifulSoup
+# html.parser: pure python parser. <br> in each cell is replaced by parsing the cell again
+# lxml: C parser. <br> in each cell is replaced in place without the second parse
+PARSERS = ['html.parser', 'lxml']
+DEFAULT_PARSER = os.environ.get('WIKI_PARSER', 'html.parser')
+
+# raise if parser is unknown or its package is not installed
+# BeautifulSoup raises FeatureNotFound for a missing parser, which load_wiki would take as a missing page
+def check_parser(parser):
+    if parser not in PARSERS:
+        raise ValueError('parser must be one of '+', '.join(PARSERS))
+    if builder_registry.lookup(parser) is None:
+        raise ValueError('parser '+parser+' is not installed. install it or set WIKI_PARSER=html.parser')
+
+check_parser(DEFAULT_PARSER) # a bad WIKI_PARSER stops the app at start instead of failing every scrape
+
+# what to download from wikipedia
+# page: whole rendered page
+# sections: lead section (infobox) and staff sections only, with mediawiki parse api
+FETCH_MODES = ['page', 'sections']
+DEFAULT_FETCH_MODE = os.environ.get('WIKI_FETCH_MODE', 'page')
+STAFF_HEADLINE = '.*スタッフ'
 
 # convert unicode to utf-8 if data is unicode
 def utf(data):
@@ -14,31 +41,28 @@ def utf(data):
     return data
 
 # return true if data include only Katakana and alphabet
-def isKatakanaOrEng(data):
-    re_katakana = re.compile(r'[\u30A1-\u30F4]+')
-    result_kana = re_katakana.fullmatch(data)
-    if result_kana is None:
-        return False
-    re_roman = re.compile(r'^[a-zA-Z]+$') #a-z:小文字、A-Z:大文字
-    result_roman = re_roman.fullmatch(data)
-    if result_roman is None:
-        return False
-
-    # for d in data:
-    #     if not ( '゠' <= utf(d) <= 'ヿ' or re.search('\w', utf(d)) ):
-    #         return False
-    
-    return True
+isKatakanaOrEng = is_katakana_or_eng
 
 class WikiScraper(object):
-    def __init__(self):
+    # cache: WikiCache for fetched pages. default is configured by WIKI_CACHE_DIR
+    # client: WikiClient to fetch pages. default is shared in the process
+    # parser: one of PARSERS. default is WIKI_PARSER environment variable
+    # fetch_mode: one of FETCH_MODES. default is WIKI_FETCH_MODE environment variable
+    def __init__(self, cache=None, client=None, parser=None, fetch_mode=None):
+        self._parser = parser if parser is not None else DEFAULT_PARSER
+        check_parser(self._parser)
+        self._fetch_mode = fetch_mode if fetch_mode is not None else DEFAULT_FETCH_MODE
+        if self._fetch_mode not in FETCH_MODES:
+            raise ValueError('fetch_mode must be one of '+', '.join(FETCH_MODES))
+        self._cache = cache if cache is not None else get_default_cache()
+        self._client = client if client is not None else get_default_client()
         self._name = ''
         self._page = ''
         self._bsObj = None
         self._headlines = []
         self._headline_tag = 'h3'
         self._last_key = ''
-        self._result = dict()
+        self._result = OrderedDedupDict()
 
     # return string of 'key : value \n'
     def __str__(self):
@@ -53,9 +77,11 @@ class WikiScraper(object):
     def load(self, name, lang='ja', pageid=np.nan):
         self.load_wiki(name=name, pageid=pageid, lang=lang)
         if self._bsObj is not None:
-            self.get_list_from_headline('.*スタッフ')
-            self.get_table('infobox')
-            return True, self._result
+            with stage('wiki_extract'):
+                self.get_list_from_headline(STAFF_HEADLINE)
+                self.get_table('infobox')
+            # plain dict, the writes of ElasticUtilNameId accept only dict bodies
+            return True, dict(self._result)
         else:
             return False, []
 
@@ -67,24 +93,92 @@ class WikiScraper(object):
     def load_wiki(self, name, lang='ja', pageid=np.nan):
         # wikipedia.set_lang(lang)
         try:
-            url = 'https://ja.wikipedia.org/wiki/'+name
-            print(url)
-            r = requests.get(url)
-            self._page = r.text
+            with stage('wiki_fetch'):
+                self._page = self.fetch(name, lang, pageid)
             # if np.isnan(pageid):
             #     self._page = wikipedia.page(name).html()
             #     print(self._page, type(self._page))
             # else:
             #     self._page = wikipedia.page(pageid=int(pageid)).html()
-            self.load_html(name, self._page)
+            with stage('wiki_parse'):
+                self.load_html(name, self._page)
         except:
             print('Can not open wikipage of '+name+' with lang '+lang)    
+
+    # get html from the cache or wikipedia
+    # expired cache entry is revalidated with ETag and Last-Modified
+    def fetch(self, name, lang='ja', pageid=np.nan):
+        variant = '' if self._fetch_mode == 'page' else self._fetch_mode
+        cached = None
+        headers = {}
+        if self._cache is not None:
+            cached = self._cache.get(lang, name, pageid, variant)
+            if cached is not None:
+                html, meta, fresh = cached
+                if fresh:
+                    return html
+                headers = self._cache.conditional_headers(meta)
+            elif self._cache.offline:
+                raise IOError(name+' is not in the offline cache')
+
+        if self._fetch_mode == 'sections':
+            html = self.fetch_sections(name, lang)
+            if self._cache is not None:
+                self._cache.put(lang, name, pageid, html, url=self._client.page_url(name, lang), variant=variant)
+            return html
+
+        url = self._client.page_url(name, lang)
+        print(url)
+        r = self._client.get(url, headers=headers)
+        if r.status_code == 304 and cached is not None:
+            self._cache.refresh(lang, name, pageid)
+            return cached[0]
+        r.raise_for_status()
+        if self._cache is not None:
+            self._cache.put(lang, name, pageid, r.text, url=url, headers=r.headers)
+        return r.text
+
+    # get html of the lead section and the sections under headline with mediawiki parse api
+    # the lead section has the infobox. subsections are included in the section html
+    # so the result of get_list_from_headline and get_table is same as the whole page
+    def fetch_sections(self, name, lang='ja', headline=STAFF_HEADLINE):
+        params = {'action': 'parse', 'page': name, 'format': 'json', 'formatversion': 2, 'redirects': 1}
+        sections = self._client.get_api(dict(params, prop='sections'), lang)['parse']['sections']
+
+        indexes = ['0']
+        numbers = []
+        for section in sections:
+            line = re.sub('<[^>]+>', '', section['line'])
+            if not re.search(headline, line):
+                continue
+            # skip subsection of the selected section
+            if any(section['number'].startswith(n+'.') for n in numbers):
+                continue
+            if not section['index'].isdigit():
+                logging.warning('Can not get section '+section['index']+' of '+name+' from template')
+                continue
+            numbers.append(section['number'])
+            indexes.append(section['index'])
+
+        urls = [self._client.api_url(dict(params, prop='text', section=i), lang) for i in indexes]
+        logging.debug('sections '+', '.join(indexes)+' of '+name+': '+urls[0])
+        html = '<html><body>'
+        for r in self._client.get_many(urls):
+            if isinstance(r, Exception):
+                raise r
+            r.raise_for_status()
+            html += r.json()['parse']['text']
+        html += '</body></html>'
+        return html
     
     # load html
     # name: title of wikipage
     # html: html string
     def load_html(self, name, html):
-        self._bsObj = BeautifulSoup(html, "html.parser", from_encoding='utf-8')   
+        if self._parser == 'lxml':
+            self._bsObj = BeautifulSoup(html, 'lxml')
+        else:
+            self._bsObj = BeautifulSoup(html, "html.parser", from_encoding='utf-8')   
         self._name = name
     
     # find headline
@@ -103,25 +197,9 @@ class WikiScraper(object):
     # remove brackets, blank, and \n
     def cleanup_text(func):
         def wrapper(self, key, data):
-            value = []
-            data = data
-            data = re.sub('(［|\[).+?(］|\])','', data) #remove brackets
-            data = re.sub('(（|\(|\（).+?(）|\）|\))','', data) #remove brackets
-            data = data.strip()  #remove \n, and blank from head and tail
-            
-            #exception
-            for e in EXCEPTION:
-                if e in data:
-                    value.append(e)
-                    data = data.replace(e,'')
-            
+            value, data = clean_text(data)
             value = func(key, data, value)
-            key = key.strip()
-            if key in self._result:
-                self._result[key].extend(value)
-                self._result[key] = list(set(self._result[key]))
-            else:
-                 self._result[key] = value
+            self._result.extend(key.strip(), value)
 
         return wrapper
 
@@ -129,37 +207,13 @@ class WikiScraper(object):
     # separate line with , / -> and etc. 
     @cleanup_text
     def cleanup_value_list(key, data, value):
-        data = re.split('-', data)[0]
-        
-        data = re.split('[,、/／→\n]', data) #separate multiple staffs    
-        for d in data:
-            d = d.strip()
-            if not isKatakanaOrEng(d): #separate with '・' for ウレロシリーズ
-                value.extend(re.split('[・]', d)) #separate multiple staffs    
-#             value.extend(re.split('[,、/／→\n]', data)) #separate multiple staffs    
-            else:
-                value.append(d) # do not separate with '・' for foregin people
-#             value.extend(re.split('[,、/・／→\n]', data)) #separate multiple staffs    
-
-        for i, v in enumerate(value): #remove ※
-            value[i]  = re.split('※|●', v)[0].strip()
-        
-        return value
+        return tokenize_list(data, value)
 
     # cleanup value
     # separate line with , / -> and etc. 
     @cleanup_text
     def cleanup_value_infobox(key, data, value):
-        data = re.split('[※|●]', data)[0]
-        data = re.split('[,、/→\n]', data) #separate multiple staffs    
-        for d in data:
-            d = d.strip()
-            if not isKatakanaOrEng(d): #separate with '・' for ウレロシリーズ
-                value.extend(re.split('[・]', d)) #separate multiple staffs    
-            else:
-                value.append(d) # do not separate with '・' for foregin people
-
-        return value
+        return tokenize_infobox(data, value)
     
     # get list data
     def find_list(self, elt, parent=''):
@@ -256,7 +310,7 @@ class WikiScraper(object):
                 if elt.name is not None and re.match('h[1-6]', elt.name) and elt.name <= self._headline_tag:
                     break
 
-                if hasattr(elt, 'text'):
+                if isinstance(elt, bs4elem.Tag):
                     self.find_list(elt)
 
     def find_tr(self, table):
@@ -270,15 +324,26 @@ class WikiScraper(object):
                     key = index.get_text()
                     value = row.find('td')
                     if value is not None:
-                        # replace <br> with \n  to get by .text()
-                        value_str = re.sub('</*br/*>', '\n', str(value))
-                        value = BeautifulSoup(value_str, "html.parser",  from_encoding='utf-8')
-        #                    value = value.get_text().split('\n')
-                        value = self.cleanup_value_infobox(key, value.get_text())
+                        value = self.cleanup_value_infobox(key, self.cell_text(value))
 
         #                     self._result[key] = value
 
 
+    # text of table cell with <br> as \n
+    def cell_text(self, cell):
+        if self._parser == 'lxml':
+            # same as the regex below. <br> with attributes is not replaced
+            for br in cell.find_all('br'):
+                if not br.attrs:
+                    br.replace_with('\n')
+            return cell.get_text()
+
+        # replace <br> with \n  to get by .text()
+        value_str = re.sub('</*br/*>', '\n', str(cell))
+        value = BeautifulSoup(value_str, "html.parser",  from_encoding='utf-8')
+#                    value = value.get_text().split('\n')
+        return value.get_text()
+
     def get_table(self, class_name='infobox'):
         tables = self._bsObj.findAll('table',{'class':class_name})
         for table in tables:
@@ -286,6 +351,27 @@ class WikiScraper(object):
 
 
 
+# concurrent scrapes of the same page share one call, from the api and bulk loads alike
+wiki_flight = SingleFlight()
+
+# scrape the page of name, or of wiki_id if it is not nan
+# return (wiki data, 200) or (message, 404)
+def scrape_wiki(name, wiki_id):
+    wsc = WikiScraper()
+    res, wiki_data = wsc.load(name=name, pageid=wiki_id, lang='ja')
+    if not res:
+        msg = name + ' not found in wikipedia. Please try again'
+        if np.isnan(wiki_id):
+            msg += ' or try with page id.'
+        else:
+            msg += '.'
+        return msg, 404
+    return wiki_data, 200
+
+def wiki_load(name, wiki_id):
+    key = (name, None if np.isnan(wiki_id) else int(wiki_id))
+    return wiki_flight.do(key, scrape_wiki, name, wiki_id)
+
 
 if __name__ == "__main__":
     p = None
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# production entry point of api.py
+# usage: gunicorn -c gunicorn.conf.py wsgi:app
+# usage to measure cold start (import and create_app in a new process):
+#   python wsgi.py --runs 5
+
+import sys
+import argparse
+import subprocess
+
+from api import create_app
+
+app = create_app()
+
+COLD_START = '''
+import time
+start = time.perf_counter()
+import wsgi
+created = time.perf_counter()
+client = wsgi.app.test_client()
+client.get('/swagger.json')
+print(created - start, time.perf_counter() - start)
+'''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measure cold start of the app')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for i in range(args.runs):
+        out = subprocess.check_output([sys.executable, '-c', COLD_START], stderr=subprocess.DEVNULL)
+        results.append([float(t) for t in out.decode().split()])
+    results.sort()
+    created, first = results[len(results)//2]
+    print('median of '+str(args.runs)+' runs: create_app '+'{:.3f}'.format(created)+'s, first request '+'{:.3f}'.format(first)+'s')